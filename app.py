@@ -1,16 +1,165 @@
 import os
 import argparse
-from core.api import app, configure_client
+from core.api import app, configure_router, configure_speculative_tool_calls, configure_tracing
+from core.conversation import configure_tool_results
+from core.prompt import configure_prompt_cache
+from core.router import STRATEGIES, RoutePolicy, Upstream, load_upstreams
+from core.tool_registry import configure_tool_registry
+from core.tool_selection import configure_tool_selection
+from core.warmup import HEAVY_MODULES, KERNEL_MODULES, start_background_warm_up
+from utils.code_generation import CODEGEN_MODES, configure_code_cache, configure_codegen
+from utils.disk_cache import configure_disk_cache
+from utils.request_log import COMPRESSIONS, configure_request_log
+from utils.response_cache import RESPONSE_CACHE_BACKENDS, configure_response_cache
+from utils.code_execution import EXECUTION_BACKENDS, EXTRACTION_MODES, configure_executor, configure_extraction, configure_kernel_pool, configure_process_pool, configure_tool_call_workers
 
-if __name__ == "__main__":
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description='DeepSeek OpenAI Tools Proxy')
     parser.add_argument('--api-key', default=os.environ.get("DEEPSEEK_API_KEY"), help='API key for authentication')
     parser.add_argument('--base-url', default="https://api.deepseek.com", help='Base URL for the API')
+    parser.add_argument('--upstreams', default=None, help='JSON file of upstreams and per-model routes to balance requests over (default: --base-url only)')
+    parser.add_argument('--routing-strategy', choices=STRATEGIES, default='least_outstanding', help='How the upstream of a request is chosen')
+    parser.add_argument('--upstream-retries', type=int, default=2, help='Attempts retried on another upstream after a connection, rate limit or server error')
+    parser.add_argument('--upstream-backoff', type=float, default=0.2, help='Base delay in seconds before a retry, doubled on each attempt and jittered')
+    parser.add_argument('--hedge-percentile', type=float, default=None, help='Send a second attempt to another upstream when the first is slower than this latency percentile, e.g. 0.95 (default: disabled)')
+    parser.add_argument('--circuit-failures', type=int, default=3, help='Consecutive failures before an upstream is taken out of rotation')
+    parser.add_argument('--circuit-cooldown', type=float, default=30.0, help='Seconds an upstream stays out of rotation before it is tried again')
+    parser.add_argument('--health-check-interval', type=float, default=None, help='Seconds between health checks of failing upstreams (default: disabled)')
     parser.add_argument('--port', type=int, default=8001, help='Port to run the server on')
-    
-    args = parser.parse_args()
-    
-    # Configure the OpenAI client with command line arguments
-    configure_client(args.api_key, args.base_url)
-    
-    app.run(debug=True, port=args.port)
+    parser.add_argument('--codegen', choices=CODEGEN_MODES, default='direct', help='Build models straight from simple tool schemas (direct) or always use datamodel-code-generator (datamodel)')
+    parser.add_argument('--code-cache-size', type=int, default=256, help='Maximum number of generated tool sets kept in memory')
+    parser.add_argument('--code-cache-ttl', type=float, default=None, help='Seconds before a cached tool set is regenerated (default: never)')
+    parser.add_argument('--disk-cache-dir', default=None, help='Directory of the on-disk generated code cache shared by workers (default: disabled)')
+    parser.add_argument('--disk-cache-max-mb', type=int, default=256, help='Size cap of the on-disk code cache')
+    parser.add_argument('--interned-tool-sets', type=int, default=256, help='Inline tool sets kept interned with their compiled code, registered ones are kept until deleted')
+    parser.add_argument('--tool-selection-top-k', type=int, default=None, help='Send only the tools most relevant to the conversation, at most this many plus the tools it used (default: send every tool)')
+    parser.add_argument('--tool-selection-window', type=int, default=4, help='Recent non-system messages tools are ranked against')
+    parser.add_argument('--prompt-cache-size', type=int, default=256, help='Maximum number of rendered tool prompts kept in memory')
+    parser.add_argument('--max-tool-result-bytes', type=int, default=None, help='Truncate tool results above this size, keeping their head and tail (default: never)')
+    parser.add_argument('--tool-result-tail-fraction', type=float, default=0.25, help='Share of the truncated tool result size kept from its end')
+    parser.add_argument('--executor', choices=list(EXECUTION_BACKENDS), default='process', help='Backend used to evaluate tool calls')
+    parser.add_argument('--extraction', choices=EXTRACTION_MODES, default='ast', help='Resolve literal tool calls statically (ast) or always execute them (execute)')
+    parser.add_argument('--kernel-pool-size', type=int, default=4, help='Kernel executor: pre-started kernels kept warm (0 starts one kernel per call)')
+    parser.add_argument('--kernel-max-executions', type=int, default=100, help='Kernel executor: executions before a pooled kernel is recycled')
+    parser.add_argument('--kernel-max-memory-mb', type=float, default=None, help='Kernel executor: resident memory above which a pooled kernel is recycled')
+    parser.add_argument('--kernel-warmup-code', default=None, help='Kernel executor: code run in every pooled kernel at startup (default: import pydantic)')
+    parser.add_argument('--sandbox-workers', type=int, default=4, help='Process executor: sandboxed worker processes kept running')
+    parser.add_argument('--sandbox-max-tasks', type=int, default=1000, help='Process executor: tool calls before a worker is recycled')
+    parser.add_argument('--sandbox-timeout', type=float, default=5.0, help='Process executor: seconds before a tool call is abandoned and its worker killed')
+    parser.add_argument('--sandbox-cpu-seconds', type=float, default=2.0, help='Process executor: CPU time allowed per tool call')
+    parser.add_argument('--sandbox-memory-mb', type=float, default=512, help='Process executor: address space limit of each worker')
+    parser.add_argument('--tool-call-workers', type=int, default=8, help='Tool calls of one completion evaluated concurrently')
+    parser.add_argument('--request-log', default='requests.jsonl', help='File incoming requests are appended to (empty string disables logging)')
+    parser.add_argument('--request-log-sample-rate', type=float, default=1.0, help='Fraction of requests written to the request log')
+    parser.add_argument('--request-log-queue-size', type=int, default=10000, help='Requests buffered for the log writer before new ones are dropped')
+    parser.add_argument('--request-log-max-bytes', type=int, default=None, help='Rotate the request log once it reaches this size')
+    parser.add_argument('--request-log-rotate-seconds', type=float, default=None, help='Rotate the request log after this many seconds')
+    parser.add_argument('--request-log-compression', choices=COMPRESSIONS, default='none', help='Compression applied to rotated request logs')
+    parser.add_argument('--response-cache', choices=RESPONSE_CACHE_BACKENDS, default=None, help='Cache responses of deterministic (temperature=0) requests in memory or in SQLite (default: disabled)')
+    parser.add_argument('--response-cache-path', default='response_cache.sqlite3', help='Database file of the sqlite response cache')
+    parser.add_argument('--response-cache-size', type=int, default=1024, help='Maximum number of cached responses')
+    parser.add_argument('--response-cache-ttl', type=float, default=None, help='Seconds a cached response stays valid (default: forever)')
+    parser.add_argument('--response-cache-force', action='store_true', help='Also cache responses of requests with non-deterministic sampling')
+    parser.add_argument('--speculative-tool-calls', action='store_true', help='Stream non-streaming requests from upstream and resolve tool calls as their code blocks complete')
+    parser.add_argument('--trace-requests', action='store_true', help='Add X-Request-ID and Server-Timing stage durations to responses')
+    parser.add_argument('--preload-tools', default=None, help='.json or .jsonl file of tool definitions to generate code for at startup')
+    parser.add_argument('--async', dest='async_mode', action='store_true', help='Serve with the asyncio (ASGI) server instead of the Flask dev server')
+    parser.add_argument('--max-connections', type=int, default=512, help='Async mode: size of the upstream connection pool')
+    parser.add_argument('--max-keepalive-connections', type=int, default=64, help='Async mode: idle upstream connections kept open')
+    parser.add_argument('--request-timeout', type=float, default=600.0, help='Async mode: upstream request timeout in seconds, also the time allowed to send a response')
+    parser.add_argument('--max-concurrency', type=int, default=256, help='Async mode: maximum concurrent upstream requests')
+    parser.add_argument('--max-pending', type=int, default=1024, help='Async mode: requests allowed to wait for an upstream slot before answering 503')
+    parser.add_argument('--worker-threads', type=int, default=None, help='Async mode: threads used for code generation and tool call evaluation')
+    return parser
+
+
+def router_settings(args) -> tuple[list[Upstream], dict]:
+    """Upstreams and routing options from the command line, shared by the sync and async servers"""
+    policy = RoutePolicy(args.routing_strategy, args.upstream_retries, args.upstream_backoff, args.hedge_percentile)
+    if args.upstreams:
+        upstreams, routes = load_upstreams(args.upstreams, policy)
+    else:
+        upstreams, routes = [Upstream(args.base_url, args.api_key)], {}
+    router_options = dict(routes=routes, policy=policy, failure_threshold=args.circuit_failures,
+                          cooldown=args.circuit_cooldown, health_check_interval=args.health_check_interval)
+    return upstreams, router_options
+
+
+def configure_pipeline(args):
+    """
+    Configures code generation, the caches, prompts and tool call evaluation. None of it
+    holds threads or connections, so it can be done before server workers are forked
+    """
+    configure_codegen(args.codegen)
+    configure_code_cache(args.code_cache_size, args.code_cache_ttl)
+    configure_disk_cache(args.disk_cache_dir, args.disk_cache_max_mb * 1024 * 1024)
+    configure_prompt_cache(args.prompt_cache_size, args.code_cache_ttl)
+    configure_tool_registry(args.interned_tool_sets)
+    configure_tool_selection(args.tool_selection_top_k, args.tool_selection_window)
+    configure_tool_results(args.max_tool_result_bytes, args.tool_result_tail_fraction)
+    configure_executor(args.executor)
+    configure_extraction(args.extraction)
+    configure_tracing(args.trace_requests)
+    configure_speculative_tool_calls(args.speculative_tool_calls)
+
+
+def configure_services(args):
+    """
+    Starts what every serving process needs its own of: the upstream router, the request
+    log writer, the response cache, the tool call threads and the sandbox or kernel pool
+    """
+    upstreams, router_options = router_settings(args)
+    configure_router(upstreams, **router_options)
+    configure_request_log(
+        args.request_log,
+        max_queue=args.request_log_queue_size,
+        max_bytes=args.request_log_max_bytes,
+        rotate_interval=args.request_log_rotate_seconds,
+        compression=args.request_log_compression,
+        sample_rate=args.request_log_sample_rate
+    )
+    configure_tool_call_workers(args.tool_call_workers)
+    configure_response_cache(args.response_cache, args.response_cache_path, args.response_cache_size,
+                             args.response_cache_ttl, args.response_cache_force)
+    if args.executor == 'process':
+        configure_process_pool(args.sandbox_workers, args.sandbox_max_tasks, args.sandbox_timeout,
+                               args.sandbox_cpu_seconds, args.sandbox_memory_mb)
+    if args.executor == 'kernel':
+        configure_kernel_pool(args.kernel_pool_size, args.kernel_max_executions, args.kernel_max_memory_mb, args.kernel_warmup_code)
+
+
+def warm_up_modules(args) -> tuple:
+    return HEAVY_MODULES + (KERNEL_MODULES if args.executor == 'kernel' else ())
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    configure_pipeline(args)
+    configure_services(args)
+    start_background_warm_up(warm_up_modules(args), args.preload_tools)
+
+    if args.async_mode:
+        import asyncio
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config
+        from core.asgi import app as asgi_app, configure_async_server
+
+        upstreams, router_options = router_settings(args)
+        configure_async_server(
+            args.api_key,
+            args.base_url,
+            max_connections=args.max_connections,
+            max_keepalive_connections=args.max_keepalive_connections,
+            timeout=args.request_timeout,
+            max_concurrency=args.max_concurrency,
+            max_pending_requests=args.max_pending,
+            worker_threads=args.worker_threads,
+            upstreams=upstreams,
+            **router_options
+        )
+        config = Config()
+        config.bind = [f"127.0.0.1:{args.port}"]
+        asyncio.run(serve(asgi_app, config))
+    else:
+        app.run(debug=True, port=args.port)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Offline batch mode: runs every request body of a JSONL file through the same
+pipeline as /chat/completions, without going through HTTP.
+
+Requests are processed with bounded concurrency against the upstream and share
+the generated code, prompt and model caches, so items using the same tools
+only pay for code generation once. Results are appended to the output file in
+completion order as {"line": n, "response": ...} or {"line": n, "error": ...},
+n being the 1-based line number of the request in the input file. The output
+doubles as the checkpoint: re-running the same command skips lines that
+already have a response and retries the others.
+
+    python batch.py requests.jsonl results.jsonl --concurrency 64
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator
+from core import api
+from utils.code_execution import EXECUTION_BACKENDS, EXTRACTION_MODES, configure_executor, configure_extraction
+from utils.disk_cache import configure_disk_cache
+from utils.request_log import configure_request_log
+from utils.response_cache import RESPONSE_CACHE_BACKENDS, configure_response_cache
+from utils.response_encoder import encode_json
+
+logger = logging.getLogger('tool_call_code_execution')
+
+
+def completed_lines(output_path: str) -> set[int]:
+    """
+    Returns the input line numbers that already have a response in the output file,
+    dropping a partially written last record left by an interrupted run
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, 'rb+') as f:
+        valid_size = 0
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                break
+            valid_size += len(raw)
+            if 'response' in record:
+                done.add(record['line'])
+        f.truncate(valid_size)
+    return done
+
+
+def read_requests(input_path: str, skip: set[int]) -> Iterator[tuple[int, str]]:
+    """Yields (line number, raw request body) for every non-empty line not in skip"""
+    with open(input_path, encoding='utf-8') as f:
+        for number, line in enumerate(f, start=1):
+            if number not in skip and line.strip():
+                yield number, line
+
+
+def process(line: str) -> dict:
+    """Runs one request body through the proxy pipeline and returns the response body"""
+    chat, messages = api.prepare_request(line)
+    # Batch results are collected whole, streaming would only add overhead
+    chat.stream = False
+    body, _ = api.complete(chat, messages)
+    return body
+
+
+def run_batch(input_path: str, output_path: str, concurrency: int = 32, flush_every: int = 100) -> dict:
+    """Processes the input file into the output file, resuming after the lines already answered"""
+    done = completed_lines(output_path)
+    if done:
+        logger.info(f"Resuming: {len(done)} requests already have a response in {output_path}")
+
+    stats = {"skipped": len(done), "succeeded": 0, "failed": 0}
+    start = time.perf_counter()
+    requests = read_requests(input_path, done)
+    pending = {}
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch') as pool, \
+            open(output_path, 'ab') as output:
+        while True:
+            # Keep a bounded window of requests in flight so huge inputs aren't read into memory
+            for number, line in requests:
+                pending[pool.submit(process, line)] = number
+                if len(pending) >= concurrency * 2:
+                    break
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                number = pending.pop(future)
+                try:
+                    record = {"line": number, "response": future.result()}
+                    stats["succeeded"] += 1
+                except Exception as e:
+                    logger.error(f"Request on line {number} failed: {str(e)}")
+                    record = {"line": number, "error": str(e)}
+                    stats["failed"] += 1
+                output.write(encode_json(record) + b"\n")
+
+                written = stats["succeeded"] + stats["failed"]
+                if written % flush_every == 0:
+                    output.flush()
+                    elapsed = time.perf_counter() - start
+                    logger.info(f"{written} requests done ({written / elapsed:.1f}/s), {stats['failed']} failed")
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a JSONL file of chat completion requests through the proxy pipeline')
+    parser.add_argument('input', help='JSONL file with one OpenAI chat completion request body per line')
+    parser.add_argument('output', help='JSONL file results are appended to, also used to resume an interrupted run')
+    parser.add_argument('--api-key', default='lol', help='API key for authentication')
+    parser.add_argument('--base-url', default='http://0.0.0.0:4000/v1', help='Base URL for the API')
+    parser.add_argument('--concurrency', type=int, default=32, help='Requests sent to the upstream concurrently')
+    parser.add_argument('--executor', choices=list(EXECUTION_BACKENDS), default='process', help='Backend used to evaluate tool calls')
+    parser.add_argument('--extraction', choices=EXTRACTION_MODES, default='ast', help='Resolve literal tool calls statically (ast) or always execute them (execute)')
+    parser.add_argument('--disk-cache-dir', default=None, help='Directory of the on-disk generated code cache (default: disabled)')
+    parser.add_argument('--response-cache', choices=RESPONSE_CACHE_BACKENDS, default=None, help='Cache responses of deterministic requests (default: disabled)')
+    parser.add_argument('--response-cache-path', default='response_cache.sqlite3', help='Database file of the sqlite response cache')
+    parser.add_argument('--speculative-tool-calls', action='store_true', help='Stream from upstream and resolve tool calls as their code blocks complete')
+    parser.add_argument('--request-log', default=None, help='File requests are appended to (default: disabled)')
+    args = parser.parse_args()
+
+    api.configure_client(args.api_key, args.base_url)
+    configure_request_log(args.request_log)
+    configure_disk_cache(args.disk_cache_dir)
+    configure_response_cache(args.response_cache, args.response_cache_path, max_size=1_000_000)
+    configure_executor(args.executor)
+    configure_extraction(args.extraction)
+    api.configure_speculative_tool_calls(args.speculative_tool_calls)
+
+    stats = run_batch(args.input, args.output, args.concurrency)
+    logger.info(f"Batch finished: {json.dumps(stats)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Compares the cost of compiling tool sets into models with the direct schema
+compiler and with datamodel-code-generator, for tool sets of increasing size.
+Every iteration starts from an empty code cache, so it measures cold builds.
+
+    python -m benchmarks.codegen --sizes 1 10 100 --iterations 5 --output codegen.json
+"""
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.fixtures import make_tools
+from benchmarks.load_test import git_commit
+from utils import code_generation
+from utils.code_generation import CODEGEN_MODES, configure_codegen, get_compiled_tools
+
+
+def bench_mode(mode: str, tools: list[dict], iterations: int) -> dict:
+    configure_codegen(mode)
+    # Pays for the lazy imports of the compiler outside of the measurements
+    get_compiled_tools(tools[:1], return_args=True)
+
+    samples = []
+    for _ in range(iterations):
+        code_generation.code_cache.clear()
+        start = time.perf_counter()
+        get_compiled_tools(tools, return_args=True)
+        samples.append(time.perf_counter() - start)
+
+    median = statistics.median(samples)
+    return {
+        "mode": mode,
+        "tools": len(tools),
+        "seconds": {"min": min(samples), "median": median, "max": max(samples)},
+        "us_per_tool": median / len(tools) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tool set compilation benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100], help='Number of tools per tool set')
+    parser.add_argument('--iterations', type=int, default=5, help='Cold builds measured per size and mode')
+    parser.add_argument('--modes', nargs='+', default=CODEGEN_MODES, choices=CODEGEN_MODES)
+    parser.add_argument('--output', default=None, help='Write results to this JSON file (default: stdout only)')
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "runs": [bench_mode(mode, make_tools(size), args.iterations) for size in args.sizes for mode in args.modes],
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
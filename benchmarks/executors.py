@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Compares tool call throughput of the execution backends on the
+generated code recorded in code_execution_log.txt
+
+    python -m benchmarks.executors --iterations 200 --kernel-iterations 3
+"""
+import argparse
+import ast
+import json
+import time
+from pathlib import Path
+
+from utils.code_execution import EXECUTION_BACKENDS
+from utils.code_generation import CompiledTools, compile_code_module
+
+LOG_FILE = Path(__file__).parent.parent / 'code_execution_log.txt'
+AUTHORIZED_IMPORTS = ['pydantic', '__future__']
+
+
+def load_cases(path: Path = LOG_FILE) -> list[tuple[str, str, CompiledTools]]:
+    """Splits every logged program into its model code and the tool call snippet"""
+    text = path.read_text()
+    blocks = text.split('###### CODE TO EXECUTE ######')[1:]
+
+    cases = []
+    for i, block in enumerate(blocks):
+        source = block.split('###### /CODE TO EXECUTE ######')[0]
+        tree = ast.parse(source)
+        call = tree.body[-1].value
+        # Strip the trailing .model_dump_json() added by the proxy
+        snippet = ast.unparse(call.func.value)
+        code = ast.unparse(ast.Module(body=tree.body[:-1], type_ignores=[]))
+        module = compile_code_module(code, f'tool_models_bench_{i}')
+        tool_name = call.func.value.func.id
+        tool_models = {tool_name: call.func.value.args[0].func.id}
+        cases.append((snippet, tool_name, CompiledTools(f'bench_{i}', code, module, tool_models)))
+    return cases
+
+
+def bench_backend(name: str, cases: list, iterations: int) -> dict:
+    backend = EXECUTION_BACKENDS[name]()
+    calls = 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for snippet, tool_name, compiled in cases:
+            backend.run(snippet, tool_name, compiled, AUTHORIZED_IMPORTS)
+            calls += 1
+    elapsed = time.perf_counter() - start
+    return {
+        'backend': name,
+        'calls': calls,
+        'seconds': elapsed,
+        'calls_per_second': calls / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Execution backend throughput benchmark')
+    parser.add_argument('--iterations', type=int, default=200, help='Passes over the logged cases for in-process backends')
+    parser.add_argument('--kernel-iterations', type=int, default=1, help='Passes over the logged cases for the kernel backend')
+    parser.add_argument('--backends', nargs='+', default=list(EXECUTION_BACKENDS), choices=list(EXECUTION_BACKENDS))
+    args = parser.parse_args()
+
+    cases = load_cases()
+    results = []
+    for name in args.backends:
+        iterations = args.kernel_iterations if name == 'kernel' else args.iterations
+        results.append(bench_backend(name, cases, iterations))
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
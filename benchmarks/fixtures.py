@@ -0,0 +1,56 @@
+"""Synthetic tool definitions and scripted completions shared by the benchmarks"""
+from utils.code_generation import get_args_type_from_function
+
+
+def make_tool(i: int) -> dict:
+    return {
+        "type": "function",
+        "function": {
+            "name": f"lookup_{i}",
+            "description": f"Looks up record {i} for a city and returns a forecast summary",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "location": {"type": "string", "description": "City name"},
+                    "days": {"type": "integer", "description": "Number of days to cover"},
+                    "units": {"type": "string", "enum": ["metric", "imperial"], "description": "Unit system"},
+                    "tags": {"type": "array", "items": {"type": "string"}, "description": "Free-form labels"},
+                    "include_alerts": {"type": "boolean", "description": "Whether to include alerts"}
+                },
+                "required": ["location"]
+            }
+        }
+    }
+
+
+def make_tools(n: int) -> list[dict]:
+    return [make_tool(i) for i in range(n)]
+
+
+def make_tool_call(tool: dict, i: int) -> str:
+    function = tool["function"]
+    return (
+        f'{function["name"]}({get_args_type_from_function(function)}('
+        f'location="City {i}", days={i % 7 + 1}, units="metric", tags=["bench", "run-{i}"], include_alerts={i % 2 == 0}))'
+    )
+
+
+def make_completion(tools: list[dict], n_calls: int) -> str:
+    """Reasoning-style reply containing n_calls fenced tool calls"""
+    parts = ["Let me think about which tools to call. I will look up the records in parallel."]
+    for i in range(n_calls):
+        parts.append(f"```python\n{make_tool_call(tools[i % len(tools)], i)}\n```")
+    if not n_calls:
+        parts.append("No tool call is needed to answer this.")
+    return "\n\n".join(parts)
+
+
+def make_request(tools: list[dict], turns: int = 2, stream: bool = False) -> dict:
+    """A /chat/completions body with a short history including tool results"""
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"Question {turn}: what is the forecast?"})
+        messages.append({"role": "assistant", "content": make_completion(tools, 1)})
+        messages.append({"role": "tool", "name": tools[0]["function"]["name"], "content": '{"forecast": "sunny"}'})
+    messages.append({"role": "user", "content": "And now for the other cities?"})
+    return {"model": "stub-model", "messages": messages, "tools": tools, "temperature": 0, "stream": stream}
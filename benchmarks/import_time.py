@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark based on `python -X importtime`: imports a module in fresh
+interpreters and reports the wall time, the slowest imports by cumulative
+time and which heavy dependencies got imported eagerly.
+
+    python -m benchmarks.import_time --module core.api --runs 5 --output imports.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.load_test import git_commit
+
+# Dependencies that should only be imported on first use
+HEAVY_MODULES = ('openai', 'datamodel_code_generator', 'isort', 'astor', 'nbformat', 'nbconvert', 'jupyter_client')
+
+
+def parse_importtime(stderr: str) -> list[dict]:
+    """Parses `-X importtime` lines into {"module", "self_us", "cumulative_us"} records"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        imports.append({"module": module.strip(), "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return imports
+
+
+def measure(module: str) -> tuple[float, list[dict]]:
+    """Imports module in a fresh interpreter, returning the wall time and the imports it made"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True, env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    )
+    return time.perf_counter() - start, parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import time of the server modules')
+    parser.add_argument('--module', default='core.api', help='Module to import')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to measure')
+    parser.add_argument('--top', type=int, default=20, help='Slowest imports to report')
+    parser.add_argument('--output', default=None, help='Write results to this JSON file (default: stdout only)')
+    args = parser.parse_args()
+
+    walls = []
+    for _ in range(args.runs):
+        wall, imports = measure(args.module)
+        walls.append(wall)
+
+    # Report the imports of the last run, the first ones may include cold disk caches
+    imported = {record["module"] for record in imports}
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "module": args.module,
+        "wall_seconds": {"min": min(walls), "median": statistics.median(walls), "max": max(walls)},
+        "import_seconds": max((r["cumulative_us"] for r in imports if r["module"] == args.module), default=0) / 1e6,
+        "eager_heavy_modules": [name for name in HEAVY_MODULES if name in imported],
+        "slowest": sorted(imports, key=lambda r: r["cumulative_us"], reverse=True)[:args.top],
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of /chat/completions against a local stub upstream.
+
+Measures request latency percentiles and throughput under concurrency, then
+profiles the pipeline stages in-process (schema codegen, prompt build,
+upstream wait, extraction, execution, serialization) along with the memory
+allocated per request. Results are written as JSON so commits can be compared.
+
+    python -m benchmarks.load_test --requests 500 --concurrency 16 --output bench.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import threading
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import make_server
+
+from benchmarks.fixtures import make_request, make_tools
+from benchmarks.stub_upstream import start_stub_upstream
+
+
+def percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+    }
+
+
+def start_proxy(app) -> str:
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def post(url: str, body: bytes) -> float:
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"Proxy answered {response.status}")
+    return time.perf_counter() - start
+
+
+def load_test(proxy_url: str, body: dict, requests: int, concurrency: int) -> dict:
+    """Fires requests at the proxy with a fixed number of concurrent clients"""
+    payload = json.dumps(body).encode()
+    url = proxy_url + "/chat/completions"
+    errors = 0
+    latencies = []
+
+    def worker(_):
+        nonlocal errors
+        try:
+            latencies.append(post(url, payload))
+        except Exception:
+            errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "seconds": elapsed,
+        "requests_per_second": requests / elapsed,
+        "latency": percentiles(latencies),
+    }
+
+
+def profile_stages(body: dict, iterations: int) -> dict:
+    """Times each pipeline stage in-process, with the upstream call going to the stub"""
+    from core import api
+    from utils.code_execution import extract_code, evaluate_tool_calls
+    from utils import code_generation
+    from utils.code_generation import get_compiled_tools, match_tool_call
+    from utils.response_encoder import encode_json
+
+    tools = body["tools"]
+    stages = {name: [] for name in ("codegen_cold", "codegen", "prompt_build", "upstream", "extraction", "execution", "serialization")}
+    memory = []
+
+    for _ in range(iterations):
+        # Measures the configured code generation path, direct compilation by default
+        code_generation.code_cache.clear()
+        start = time.perf_counter()
+        get_compiled_tools(tools, return_args=True)
+        stages["codegen_cold"].append(time.perf_counter() - start)
+
+    for _ in range(iterations):
+        tracemalloc.start()
+
+        start = time.perf_counter()
+        compiled = get_compiled_tools(tools, return_args=True)
+        stages["codegen"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        chat, messages = api.prepare_request(body)
+        stages["prompt_build"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        response = api.router.create(chat.model, messages, **api.upstream_params(chat))
+        stages["upstream"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        calls = []
+        for _, code in extract_code(response.choices[0].message.content):
+            tool_name = match_tool_call(code, compiled.tool_models).name
+            if tool_name:
+                calls.append((code, tool_name))
+        stages["extraction"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        results = evaluate_tool_calls(calls, compiled, api.AUTHORIZED_IMPORTS)
+        stages["execution"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        tool_calls = [api.format_tool_call(name, arguments, i) for i, ((_, name), arguments) in enumerate(zip(calls, results))]
+        encode_json(api.completion_body(response, tool_calls))
+        stages["serialization"].append(time.perf_counter() - start)
+
+        memory.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        "stages": {name: percentiles(samples) for name, samples in stages.items()},
+        "peak_memory_bytes_per_request": percentiles(memory),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end /chat/completions benchmark against a stub upstream')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per concurrency level')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help='Concurrent clients to test')
+    parser.add_argument('--tools', type=int, default=10, help='Number of tools in each request')
+    parser.add_argument('--max-tool-calls', type=int, default=3, help='Upstream replies cycle through 0..N tool calls')
+    parser.add_argument('--upstream-latency', type=float, default=0.0, help='Seconds the stub upstream waits before answering')
+    parser.add_argument('--stage-iterations', type=int, default=50, help='Iterations of the in-process stage profile')
+    parser.add_argument('--output', default=None, help='Write results to this JSON file (default: stdout only)')
+    args = parser.parse_args()
+
+    from core import api
+    from utils.request_log import configure_request_log
+
+    # Keep the benchmark from filling the request log
+    configure_request_log(None)
+
+    tools = make_tools(args.tools)
+    upstream = start_stub_upstream(tools, latency=args.upstream_latency, max_tool_calls=args.max_tool_calls)
+    api.configure_client("stub", upstream.url)
+    proxy_url = start_proxy(api.app)
+    body = make_request(tools)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "config": vars(args),
+        "stage_profile": profile_stages(body, args.stage_iterations),
+        "load": [load_test(proxy_url, body, args.requests, concurrency) for concurrency in args.concurrency],
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
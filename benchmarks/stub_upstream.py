@@ -0,0 +1,116 @@
+"""
+Local OpenAI-compatible upstream returning scripted completions, so the proxy
+can be benchmarked without a live model.
+
+    python -m benchmarks.stub_upstream --port 4000 --latency 0.05 --max-tool-calls 4
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.fixtures import make_completion, make_tools
+
+
+class StubUpstream(ThreadingHTTPServer):
+    """
+    Answers every chat completion with a reply holding 0..max_tool_calls fenced
+    tool calls, cycling deterministically, after a fixed latency
+    """
+    daemon_threads = True
+
+    def __init__(self, address, tools: list[dict], latency: float = 0.0, max_tool_calls: int = 3, chunk_size: int = 16):
+        super().__init__(address, StubUpstreamHandler)
+        self.tools = tools
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self._calls = itertools.cycle(range(max_tool_calls + 1))
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/v1"
+
+    def next_completion(self) -> str:
+        with self._lock:
+            n_calls = next(self._calls)
+        return make_completion(self.tools, n_calls)
+
+
+class StubUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; avoid delayed-ACK stalls skewing latencies
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        content = self.server.next_completion()
+        time.sleep(self.server.latency)
+
+        completion_id = "chatcmpl-" + uuid.uuid4().hex
+        base = {"id": completion_id, "created": int(time.time()), "model": body.get("model", "stub-model")}
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            size = self.server.chunk_size
+            for i in range(0, len(content), size):
+                self._write_chunk({**base, "object": "chat.completion.chunk", "choices": [
+                    {"index": 0, "delta": {"content": content[i:i + size]}, "finish_reason": None}
+                ]})
+            self._write_chunk({**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": {}, "finish_reason": "stop"}
+            ]})
+            self._write_raw(b"data: [DONE]\n\n")
+            self._write_raw(b"")
+            return
+
+        payload = json.dumps({**base, "object": "chat.completion", "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content}
+        }], "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _write_chunk(self, data: dict):
+        self._write_raw(f"data: {json.dumps(data)}\n\n".encode())
+
+    def _write_raw(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_stub_upstream(tools: list[dict], port: int = 0, **options) -> StubUpstream:
+    """Starts a stub upstream on a background thread and returns it"""
+    server = StubUpstream(("127.0.0.1", port), tools, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub OpenAI-compatible upstream')
+    parser.add_argument('--port', type=int, default=4000)
+    parser.add_argument('--tools', type=int, default=5, help='Number of synthetic tools the scripted calls use')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before answering')
+    parser.add_argument('--max-tool-calls', type=int, default=3)
+    args = parser.parse_args()
+
+    server = StubUpstream(("127.0.0.1", args.port), make_tools(args.tools), args.latency, args.max_tool_calls)
+    print(f"Stub upstream listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
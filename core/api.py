@@ -1,11 +1,22 @@
 from flask import Flask, Response, request, jsonify
-import json
 import logging
 import uuid
-from openai import OpenAI
-from utils.code_generation import get_code, get_fn_names, get_fn_call_example_str, is_valid_tool_call
-from utils.code_execution import extract_code, evaluate_python_code
-from models.schemas import Message, OpenAIRequest
+from typing import TYPE_CHECKING
+from utils.code_generation import CompiledTools, get_compiled_tools, match_tool_call, tools_fingerprint
+from utils.code_execution import ToolCallRejection, extract_code, evaluate_tool_call, evaluate_tool_calls, report_rejections, submit_tool_call
+from utils.streaming import CodeBlockScanner
+from utils.request_log import configure_request_log, log_request
+from utils.response_encoder import encode_json, sse_data
+from models.schemas import OpenAIRequest
+from core import prompt, tool_registry, tool_selection
+from core.conversation import normalize_messages
+from core.router import RoutePolicy, Router, Upstream, routers
+from core.tool_registry import InvalidToolSet, UnknownToolSet
+from utils import code_generation, response_cache
+from utils.metrics import Trace, current_trace, gauge, label_key, render_prometheus, span
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletion
 
 # Configure logging
 logging.basicConfig(
@@ -19,20 +30,431 @@ app = Flask(__name__)
 model = "deepseek-reasoner"
 system_fingerprint = str(uuid.uuid4())
 
-# Initialize OpenAI client with default values
-client = None
+# Upstream router, its OpenAI clients are created on first use since importing openai is slow
+router = None
+
+def create_client(upstream: Upstream):
+    """Creates the OpenAI client of an upstream, retries are left to the router"""
+    from openai import OpenAI
+    return OpenAI(api_key=upstream.api_key, base_url=upstream.base_url, max_retries=0)
+
+def configure_router(upstreams: list[Upstream], routes: dict[str, RoutePolicy] | None = None,
+                     policy: RoutePolicy | None = None, failure_threshold: int = 3, cooldown: float = 30.0,
+                     health_check_interval: float | None = None):
+    """Routes upstream requests over the given upstreams, with per-model routing policies"""
+    global router
+    if router:
+        router.close()
+    router = Router(upstreams, create_client, policy, routes, failure_threshold, cooldown, health_check_interval)
+    routers["sync"] = router
+    logger.info(f"Configured {len(upstreams)} upstreams: {', '.join(u.name for u in upstreams)}")
 
 def configure_client(api_key: str, base_url: str):
     """Configure the OpenAI client with the provided credentials"""
-    global client
-    client = OpenAI(
-        api_key=api_key,
-        base_url=base_url
-    )
-    logger.info(f"Configured OpenAI client with base URL: {base_url}")
+    configure_router([Upstream(base_url, api_key)])
 
 # Set default configuration
 configure_client("YOUR_API_KEY", "http://0.0.0.0:4000/v1")
+configure_request_log('requests.jsonl')
+
+# Opt-in per-request trace ID and Server-Timing response headers
+trace_requests = False
+
+def configure_tracing(enabled: bool):
+    global trace_requests
+    trace_requests = enabled
+
+# Opt-in streaming from upstream for non-streaming requests, resolving tool calls while the completion is generated
+speculative_tool_calls = False
+
+def configure_speculative_tool_calls(enabled: bool):
+    global speculative_tool_calls
+    speculative_tool_calls = enabled
+
+def cache_stats() -> dict:
+    stats = {}
+    for name, cache in (("code", code_generation.code_cache), ("prompt", prompt.prompt_builder.cache)):
+        for stat, value in cache.stats().items():
+            if stat in ("size", "hits", "misses", "evictions"):
+                stats[label_key({"cache": name, "stat": stat})] = value
+    if response_cache.cache:
+        for stat, value in response_cache.cache.stats().items():
+            if stat in ("size", "hits", "misses", "bypassed", "hit_ratio"):
+                stats[label_key({"cache": "response", "stat": stat})] = value
+    return stats
+
+gauge('cache_stats', 'Entries, hits, misses and evictions of the code, prompt and response caches', cache_stats)
+
+def upstream_params(chat: OpenAIRequest) -> dict:
+    """Sampling parameters forwarded to the underlying LLM"""
+    params = {
+        'temperature': chat.temperature,
+        'top_p': chat.top_p,
+        'presence_penalty': chat.presence_penalty, 
+        'frequency_penalty': chat.frequency_penalty,
+        'stream': chat.stream,
+        'tools': None
+    }
+    return {k: v for k, v in params.items() if v is not None}
+
+def prepare_request(request_data: dict | bytes | str) -> tuple[OpenAIRequest, list[dict]]:
+    """
+    Logs and validates an incoming request, then builds the upstream messages
+    The request is either a parsed body or its raw JSON, validated straight into models
+    Returns the parsed request along with the messages to send
+    """
+    with span("parse"):
+        log_request(request_data)
+        if isinstance(request_data, dict):
+            chat = OpenAIRequest(**request_data)
+        else:
+            chat = OpenAIRequest.model_validate_json(request_data)
+
+    # Inline tools are interned so their fingerprint and generated code are shared across requests
+    with span("codegen"):
+        tool_set = tool_registry.registry.resolve(chat.tools)
+        chat.tools = tool_set.tools
+
+    # Large tool sets are narrowed down to the relevant tools, which are all tool calls may use
+    if tool_selection.selector:
+        with span("select"):
+            selection = tool_selection.selector.select(tool_set, chat.messages)
+        if selection:
+            chat.tools = selection.tool_set.tools
+            chat._prompt_tokens_saved = selection.tokens_saved
+
+    # Process and combine tool messages with user messages
+    with span("fold"):
+        if chat.messages:
+            chat.messages = normalize_messages(chat.messages)
+
+    with span("prompt"):
+        messages = prompt.prompt_builder.build_messages(chat.messages, chat.tools)
+
+    return chat, messages
+
+def response_cache_key(chat: OpenAIRequest, messages: list[dict]) -> str | None:
+    """Returns the response cache key of a request, or None when its response must not be cached"""
+    cache = response_cache.cache
+    if cache is None:
+        return None
+    params = upstream_params(chat)
+    if not cache.is_cacheable(params):
+        cache.bypass()
+        return None
+    return cache.key(chat.model, messages, tools_fingerprint(chat.tools), params)
+
+def with_fresh_tool_call_ids(response: dict) -> dict:
+    """Gives the tool calls of a cached response new IDs, as a fresh completion would have"""
+    for choice in response.get("choices", []):
+        for tool_call in choice.get("message", {}).get("tool_calls") or []:
+            tool_call["id"] = "call_" + uuid.uuid4().hex
+    return response
+
+AUTHORIZED_IMPORTS = ['pydantic', '__future__']
+
+def format_tool_call(tool_name: str, arguments: str, index: int) -> dict:
+    """Formats a resolved tool call in OpenAI's structure"""
+    return {
+        "id": "call_" + uuid.uuid4().hex,
+        "index": index,
+        "type": "function",
+        "function": {
+            "name": tool_name,
+            "arguments": arguments
+        }
+    }
+
+def resolve_tool_call(code: str, compiled: CompiledTools, index: int, fenced: bool = True):
+    """
+    Validates a code snippet and resolves its arguments
+    Returns the tool call in OpenAI's structure, or None if the snippet doesn't call a tool
+    or its arguments can't be resolved, in which case it is reported as rejected
+    """
+    match = match_tool_call(code, compiled.tool_models)
+    if not match.name:
+        rejection = ToolCallRejection.unmatched(match, code, fenced)
+        if rejection:
+            report_rejections([rejection])
+        return None
+
+    # Resolve the tool call arguments against the compiled tool models
+    try:
+        arguments = evaluate_tool_call(code, match.name, compiled, authorized_imports=AUTHORIZED_IMPORTS)
+    except Exception as e:
+        report_rejections([ToolCallRejection.from_error(match.name, code, e)])
+        return None
+
+    return format_tool_call(match.name, arguments, index)
+
+def resolve_tool_calls(content: str, tools: list[dict]) -> list[dict]:
+    """
+    Extracts every tool call found in a completion and resolves them concurrently
+    Calls that fail to resolve are left out without failing the others, and reported
+    """
+    with span("extract"):
+        code_snippets = extract_code(content)
+
+    compiled = get_compiled_tools(tools, return_args=True)
+    calls = []
+    rejections = []
+    with span("validate"):
+        for language, code in code_snippets:
+            match = match_tool_call(code, compiled.tool_models)
+            if match.name:
+                calls.append((code, match.name))
+            else:
+                rejection = ToolCallRejection.unmatched(match, code, fenced=language != "unknown")
+                if rejection:
+                    rejections.append(rejection)
+
+    results = []
+    if calls:
+        with span("execute"):
+            results = evaluate_tool_calls(calls, compiled, AUTHORIZED_IMPORTS)
+
+    return collect_tool_calls(calls, results, rejections)
+
+def collect_tool_calls(calls: list[tuple[str, str]], results: list, rejections: list[ToolCallRejection]) -> list[dict]:
+    """Formats the successfully evaluated calls and reports the others along with earlier rejections"""
+    tool_calls = []
+    for (code, tool_name), arguments in zip(calls, results):
+        if isinstance(arguments, Exception):
+            rejections.append(ToolCallRejection.from_error(tool_name, code, arguments))
+        else:
+            tool_calls.append(format_tool_call(tool_name, arguments, len(tool_calls)))
+
+    report_rejections(rejections)
+    return tool_calls
+
+class SpeculativeToolCalls:
+    """
+    Assembles an upstream completion stream into a single completion for a
+    non-streaming request, starting the evaluation of every tool call on the
+    evaluation pool as soon as its code block closes, while the rest is still generated
+    """
+
+    def __init__(self, tools: list[dict]):
+        self.compiled = get_compiled_tools(tools, return_args=True)
+        self.scanner = CodeBlockScanner()
+        self.calls = []
+        self.futures = []
+        self.rejections = []
+        self.first = None
+        self.finish_reason = None
+        self.usage = None
+        # Other text fields of the deltas, e.g. the reasoning_content of reasoning models
+        self.extra_text: dict[str, list[str]] = {}
+
+    def feed(self, chunk):
+        """Consumes an upstream chunk, submitting the tool calls of the code blocks it completes"""
+        self.first = self.first or chunk
+        if getattr(chunk, 'usage', None):
+            self.usage = chunk.usage
+        choice = chunk.choices[0] if chunk.choices else None
+        if not choice:
+            return
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+        extra = {'refusal': choice.delta.refusal, **(choice.delta.model_extra or {})}
+        for field, text in extra.items():
+            if isinstance(text, str):
+                self.extra_text.setdefault(field, []).append(text)
+        for _, code in self.scanner.feed(choice.delta.content or ""):
+            self.submit(code)
+
+    def submit(self, code: str, fenced: bool = True):
+        match = match_tool_call(code, self.compiled.tool_models)
+        if match.name:
+            self.calls.append((code, match.name))
+            self.futures.append(submit_tool_call(code, match.name, self.compiled, AUTHORIZED_IMPORTS))
+        else:
+            rejection = ToolCallRejection.unmatched(match, code, fenced)
+            if rejection:
+                self.rejections.append(rejection)
+
+    def completion(self) -> "ChatCompletion":
+        """The assembled completion, without tool calls. Call once the stream is exhausted"""
+        from openai.types.chat import ChatCompletion
+
+        # Like extract_code, treat the whole reply as a snippet when it has no code block
+        if not self.scanner.blocks_found:
+            self.submit(self.scanner.text, fenced=False)
+
+        first = self.first
+        return ChatCompletion(
+            id=first.id if first else "chatcmpl-" + uuid.uuid4().hex,
+            object="chat.completion",
+            created=first.created if first else 0,
+            model=first.model if first else "",
+            system_fingerprint=first.system_fingerprint if first else None,
+            usage=self.usage,
+            choices=[{
+                "index": 0,
+                "finish_reason": self.finish_reason or "stop",
+                "message": {
+                    "role": "assistant",
+                    "content": self.scanner.text,
+                    **{field: "".join(parts) for field, parts in self.extra_text.items()}
+                }
+            }]
+        )
+
+    def tool_calls(self) -> list[dict]:
+        """Waits for the submitted tool calls and returns them in OpenAI's structure"""
+        with span("execute"):
+            results = [future.result() for future in self.futures]
+        return collect_tool_calls(self.calls, results, self.rejections)
+
+# Streams the completion of a non-streaming request, with the usage the completion would have reported
+SPECULATIVE_STREAM = {'stream': True, 'stream_options': {'include_usage': True}}
+
+def speculative_completion(chat: OpenAIRequest, messages: list[dict]) -> tuple["ChatCompletion", list[dict]]:
+    """
+    Streams a non-streaming request from upstream, resolving its tool calls as their code blocks complete
+    Returns the completion along with its tool calls
+    """
+    collector = SpeculativeToolCalls(chat.tools)
+    with span("upstream"):
+        response = router.create(
+            chat.model,
+            messages,
+            **{**upstream_params(chat), **SPECULATIVE_STREAM}
+        )
+        for chunk in response:
+            collector.feed(chunk)
+
+    return collector.completion(), collector.tool_calls()
+
+class ToolCallStream:
+    """
+    Converts upstream chunks to server-sent events while scanning the content
+    for code blocks, emitting a tool_calls delta as soon as each block closes
+    """
+
+    def __init__(self, tools: list[dict]):
+        self.tools = tools
+        self.scanner = CodeBlockScanner()
+        self.tool_calls = 0
+        self._compiled = None
+
+    @property
+    def compiled(self) -> CompiledTools:
+        # Looked up once per stream rather than for every code block
+        if self._compiled is None:
+            self._compiled = get_compiled_tools(self.tools, return_args=True)
+        return self._compiled
+
+    def may_resolve(self, chunk) -> bool:
+        """Whether processing this chunk can resolve tool calls, as opposed to only forwarding it"""
+        choice = chunk.choices[0] if chunk.choices else None
+        return bool(choice and (choice.finish_reason or '`' in (choice.delta.content or '')))
+
+    def process(self, chunk) -> list[str]:
+        """Returns the events to send for an upstream chunk"""
+        choice = chunk.choices[0] if chunk.choices else None
+        content = choice.delta.content if choice else None
+        finished = bool(choice and choice.finish_reason)
+
+        events = []
+        if not finished:
+            events.append(sse_data(chunk.model_dump_json()))
+        if content:
+            events.extend(self.tool_call_events(chunk, self.scanner.feed(content)))
+        if finished:
+            # Like extract_code, treat the whole reply as a snippet when it has no code block
+            if not self.scanner.blocks_found:
+                events.extend(self.tool_call_events(chunk, [("unknown", self.scanner.text)]))
+            events.append(sse_data(chunk.model_dump_json()))
+        return events
+
+    def tool_call_events(self, chunk, snippets: list[tuple[str, str]]) -> list[str]:
+        events = []
+        for language, code in snippets:
+            try:
+                tool_call = resolve_tool_call(code, self.compiled, self.tool_calls, fenced=language != "unknown")
+            except Exception as e:
+                logger.error(f"Tool call evaluation error: {str(e)}")
+                continue
+            if tool_call:
+                self.tool_calls += 1
+                events.append(sse_event({
+                    "id": chunk.id,
+                    "object": "chat.completion.chunk",
+                    "created": chunk.created,
+                    "model": chunk.model,
+                    "system_fingerprint": chunk.system_fingerprint,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"tool_calls": [tool_call]},
+                        "finish_reason": None
+                    }]
+                }))
+        return events
+
+def stream_completion(response, tools: list[dict]):
+    """Forwards an upstream completion stream with tool calls emitted as they complete"""
+    stream = ToolCallStream(tools)
+    try:
+        for chunk in response:
+            yield from stream.process(chunk)
+        yield SSE_DONE
+    except Exception as e:
+        logger.error(f"Streaming error: {str(e)}")
+        raise
+
+SSE_DONE = "data: [DONE]\n\n"
+
+def sse_event(data: dict) -> str:
+    return sse_data(encode_json(data))
+
+def completion_body(response, tool_calls: list[dict]) -> dict:
+    """
+    Builds the response body of a completion with its resolved tool calls, added to the
+    dumped body so their arguments stay the JSON strings they were produced as
+    """
+    body = response.model_dump()
+    body["choices"][0]["message"]["tool_calls"] = tool_calls
+    return body
+
+def json_response(body: dict) -> Response:
+    """Serializes a response body straight to the UTF-8 bytes that are sent"""
+    return Response(encode_json(body), mimetype="application/json")
+
+def complete(chat: OpenAIRequest, messages: list[dict]) -> tuple[dict, bool]:
+    """
+    Runs a prepared non-streaming request through the upstream and resolves its tool calls
+    Returns the response body and whether it was served from the response cache
+    """
+    # Deterministic requests already answered are served without calling upstream
+    with span("cache"):
+        cache_key = response_cache_key(chat, messages)
+        cached = response_cache.cache.get(cache_key) if cache_key else None
+    if cached:
+        return with_fresh_tool_call_ids(cached), True
+
+    if speculative_tool_calls:
+        # Resolve tool calls while the upstream is still generating the rest of the completion
+        response, tool_calls = speculative_completion(chat, messages)
+    else:
+        # Make API call to underlying LLM
+        with span("upstream"):
+            response = router.create(
+                chat.model,
+                messages,
+                **upstream_params(chat)
+            )
+
+        # Extract and process tool calls from response
+        tool_calls = resolve_tool_calls(response.choices[0].message.content, chat.tools)
+
+        logger.debug(f"Resolved {len(tool_calls)} tool calls from {len(messages)} messages")
+
+    with span("serialize"):
+        body = completion_body(response, tool_calls)
+    if cache_key:
+        response_cache.cache.set(cache_key, body)
+    return body, False
 
 @app.route("/chat/completions", methods=["POST"])
 def chat():
@@ -48,156 +470,102 @@ def chat():
     6. Extracts and executes tool calls from response
     7. Returns formatted response matching OpenAI's API
     """
-    # Log incoming requests
-    request_data = request.get_json()
-    with open('requests.jsonl', 'a') as f:
-        json.dump(request_data, f)
-        f.write('\n')
-    
-    chat = OpenAIRequest(**request.get_json())
+    trace = Trace(request.headers.get("X-Request-ID")) if trace_requests else None
+    token = current_trace.set(trace)
+    try:
+        # Prepare messages with enhanced system prompt
+        chat, messages = prepare_request(request.get_data())
 
-    # Process and combine tool messages with user messages
-    if chat.messages:
-        tool_messages = []
-        new_messages = []
-        
-        for message in chat.messages:
-            if message.role == "tool":
-                tool_messages.append(f"Tool message received - Function: {message.name}, Result: {message.content}")
-            else:
-                # Combine accumulated tool messages into user message
-                if tool_messages:
-                    combined_content = "\n".join(tool_messages)
-                    if new_messages and new_messages[-1].role == "user":
-                        new_messages[-1].content += "\n\n" + combined_content
-                    else:
-                        new_messages.append(Message(role="user", content=combined_content))
-                    tool_messages = []
-                
-                new_messages.append(message)
-        
-        # Handle any remaining tool messages
-        if tool_messages:
-            combined_content = "\n".join(tool_messages)
-            new_messages.append(Message(role="user", content=combined_content))
-            
-        chat.messages = new_messages
-
-    # Generate code for tools and create enhanced system prompt
-    code = get_code(chat.tools)
-    
-    # Create example snippets for tool usage
-    dblnl = "\n\nand/or\n\n"
-    snippets = [f'```python\n{get_fn_call_example_str(tool["function"])}\n```' for tool in chat.tools]
+        # Stream content deltas and emit tool calls as soon as their code block closes
+        if chat.stream:
+            with span("upstream"):
+                response = router.create(
+                    chat.model,
+                    messages,
+                    **upstream_params(chat)
+                )
+            result = Response(stream_completion(response, chat.tools), mimetype="text/event-stream")
+            # Releases the upstream even when the client goes away before the first chunk
+            result.call_on_close(response.close)
+            return with_trace_headers(with_tool_selection_headers(result, chat), trace)
 
-    # Build system prompt with tool information
-    system_prompt_tool_suffix = f"""You have access to the following function and model:
+        body, cached = complete(chat, messages)
 
-```python
-{code}
-```
+        with span("serialize"):
+            result = json_response(body)
+        if cached:
+            result.headers["X-Cache"] = "HIT"
+        return with_trace_headers(with_tool_selection_headers(result, chat), trace)
 
-After analyzing the user request that will follow, you can call any of {{{get_fn_names(chat.tools)}}} function with your evaluation. For each function call you decide to make, format your response as a Python code block using triple backticks containing the function call. Be logical and smart about which function call you make. Each function call you make will be executed and the result shown to you in this thread. It is up to you to call the functions in any order to best accomplish the task you've been given. If any function call you want to make necessitates the use of an output of another function, you can call the other function first and only that one. Or you can call many functions to get results in parallel in next message in this thread. The functions you decide to call now will have an impact on the planning and orchestration of the task. Take time to reflect on proper order of function calls and only do the ones that don't have unawaited dependencies.
+    except UnknownToolSet as e:
+        return with_trace_headers(jsonify({"error": e.args[0]}), trace), 404
+    except InvalidToolSet as e:
+        return with_trace_headers(jsonify({"error": str(e)}), trace), 400
+    except Exception as e:
+        logger.error(f"API error: {str(e)}")
+        return with_trace_headers(jsonify({"error": str(e)}), trace), 500
+    finally:
+        current_trace.reset(token)
 
-DO NOT MAKE UP FIELDS NOT DEFINED IN THE MODEL.
-DO NOT ASSIGN VARIABLES, DO NOT PRINT, DO NOT DO ANYTHING WITH SIDE EFFECTS. PURE CODE ONLY. SIMPLY CALL THE FUNCTIONS WITH LITTERALS WITHOUT CAPTURING THE OUTPUT. EXAMPLES BELOW.
+def with_trace_headers(response, trace: Trace | None):
+    """Adds the trace ID and stage timings of a traced request to its response"""
+    if trace:
+        response.headers["X-Request-ID"] = trace.trace_id
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
 
-Function call syntax and output formatting examples:
-{dblnl.join(snippets)}
+def with_tool_selection_headers(response, chat: OpenAIRequest):
+    """Reports the prompt tokens saved by leaving tools out of the request"""
+    if chat._prompt_tokens_saved is not None:
+        response.headers["X-Prompt-Tokens-Saved"] = str(chat._prompt_tokens_saved)
+    return response
 
-The arguments you call the functions with must be relevant with the provided context."""
-    
+def tool_set_summary(tool_set: tool_registry.ToolSet) -> dict:
+    return {"id": tool_set.id, "object": "tool_set", "tools": list(tool_set.names)}
+
+def register_tools(body) -> tuple[dict, int]:
+    """Registers the tools of a POST /tools body, either {"tools": [...]} or the bare array"""
+    tools = body.get("tools") if isinstance(body, dict) else body
     try:
-        # Prepare messages with enhanced system prompt
-        messages = []
-        system_message_found = False
-        
-        # Check if there's a system message and append suffix to it
-        for m in chat.messages:
-            content = m.content
-            if m.role == "system":
-                content += f"\n\n{system_prompt_tool_suffix}"
-                system_message_found = True
-            messages.append({"role": m.role, "content": content})
-        
-        # If no system message found, create one and insert at beginning
-        if not system_message_found:
-            messages.insert(0, {
-                "role": "system",
-                "content": system_prompt_tool_suffix
-            })
+        return tool_set_summary(tool_registry.registry.register(tools)), 200
+    except InvalidToolSet as e:
+        return {"error": str(e)}, 400
 
-        # Make API call to underlying LLM
-        params = {
-            'temperature': chat.temperature,
-            'top_p': chat.top_p,
-            'presence_penalty': chat.presence_penalty, 
-            'frequency_penalty': chat.frequency_penalty,
-            'stream': chat.stream,
-            'tools': None
-        }
-        params = {k: v for k, v in params.items() if v is not None}
+@app.route("/tools", methods=["POST"])
+def post_tools():
+    """
+    Registers a tool set and returns its ID, which requests can send as `tools` in place of the array
+    The code, models and prompt of registered tool sets are compiled once and kept until deleted
+    """
+    body, status = register_tools(request.get_json(silent=True))
+    return jsonify(body), status
 
-        response = client.chat.completions.create(
-            model=chat.model,
-            messages=messages,
-            **params
-        )
+def describe_tools(tool_set_id: str) -> tuple[dict, int]:
+    try:
+        tool_set = tool_registry.registry.get(tool_set_id)
+    except UnknownToolSet as e:
+        return {"error": e.args[0]}, 404
+    return {**tool_set_summary(tool_set), "definitions": tool_set.tools}, 200
 
-        # Extract and process tool calls from response
-        code_snippets = extract_code(response.choices[0].message.content)
-        tool_calls = []
-        filled_index = 0
-
-        for code_snippet in code_snippets:
-            is_valid = is_valid_tool_call(code_snippet[1], chat.tools)
-
-            if is_valid:
-                # Generate and execute code for tool call
-                code_to_execute = (get_code(chat.tools, return_args=True) +  "\n\n" + code_snippet[1]).strip() + '.model_dump_json()'
-                
-                # Log code execution for debugging
-                logger.debug(f"Code to execute:\n{code_to_execute}")
-
-                # Format tool call in OpenAI's structure
-                tool_calls.append({
-                    "id": "call_" + uuid.uuid4().hex,
-                    "index": filled_index,
-                    "type": "function",
-                    "function": {
-                        "name": is_valid, 
-                        "arguments": eval(evaluate_python_code(code_to_execute, authorized_imports=['pydantic', '__future__']))
-                    }
-                })
-
-                filled_index += 1
-
-        print("messages", messages)
-
-        print("response", response.choices[0].message.content)
-        print("---")
-        print("tool_calls", tool_calls)
-
-        # Add tool calls to response
-        response.choices[0].message.tool_calls = tool_calls
-
-        # Handle streaming vs non-streaming response
-        if chat.stream:
-            def generate():
-                try:
-                    for chunk in response:
-                        yield f"data: {json.dumps(chunk.model_dump())}\n\n"
-                except Exception as e:
-                    logger.error(f"Streaming error: {str(e)}")
-                    raise
-            
-            return Response(generate(), mimetype="text/event-stream")
-        else:
-            return jsonify(response.model_dump())
-            
-    except Exception as e:
-        logger.error(f"API error: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+def unregister_tools(tool_set_id: str) -> tuple[dict, int]:
+    if not tool_registry.registry.unregister(tool_set_id):
+        return {"error": f"Unknown tool set '{tool_set_id}'"}, 404
+    return {"id": tool_set_id, "object": "tool_set", "deleted": True}, 200
+
+@app.route("/tools/<tool_set_id>", methods=["GET"])
+def get_tools(tool_set_id: str):
+    body, status = describe_tools(tool_set_id)
+    return jsonify(body), status
+
+@app.route("/tools/<tool_set_id>", methods=["DELETE"])
+def delete_tools(tool_set_id: str):
+    body, status = unregister_tools(tool_set_id)
+    return jsonify(body), status
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
-    app.run(debug=False, port=8001) 
\ No newline at end of file
+    app.run(debug=False, port=8001)
\ No newline at end of file
@@ -0,0 +1,280 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from quart import Quart, Response, request, jsonify
+from core import api
+from core.router import RoutePolicy, Router, Upstream, routers
+from core.tool_registry import InvalidToolSet, UnknownToolSet
+from core.api import SPECULATIVE_STREAM, SSE_DONE, SpeculativeToolCalls, completion_body, sse_event, ToolCallStream, describe_tools, logger, prepare_request, register_tools, unregister_tools, resolve_tool_calls, response_cache_key, upstream_params, with_fresh_tool_call_ids, with_tool_selection_headers, with_trace_headers
+from utils import response_cache
+from utils.metrics import Trace, current_trace, render_prometheus, span
+from utils.response_encoder import encode_json
+
+# ASGI flavour of core.api: same /chat/completions contract, served from an event loop
+app = Quart(__name__)
+
+router = None
+executor = None
+limiter = None
+request_timeout = None
+max_pending = None
+waiting = 0
+
+def configure_async_server(
+    api_key: str,
+    base_url: str,
+    max_connections: int = 512,
+    max_keepalive_connections: int = 64,
+    timeout: float = 600.0,
+    max_concurrency: int = 256,
+    max_pending_requests: int = 1024,
+    worker_threads: int | None = None,
+    upstreams: list[Upstream] | None = None,
+    routes: dict[str, RoutePolicy] | None = None,
+    policy: RoutePolicy | None = None,
+    failure_threshold: int = 3,
+    cooldown: float = 30.0,
+    health_check_interval: float | None = None
+):
+    """
+    Configure the router over pooled AsyncOpenAI clients (one upstream at base_url unless
+    upstreams are given), the concurrency limit on upstream calls and the thread pool
+    running code generation and tool call evaluation
+    """
+    global router, executor, limiter, request_timeout, max_pending
+
+    def create_client(upstream: Upstream):
+        # Imported on first use, like in core.api
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        return AsyncOpenAI(
+            api_key=upstream.api_key,
+            base_url=upstream.base_url,
+            timeout=timeout,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections
+                )
+            )
+        )
+
+    if router:
+        router.close()
+    upstreams = upstreams or [Upstream(base_url, api_key)]
+    router = Router(upstreams, create_client, policy, routes, failure_threshold, cooldown, health_check_interval)
+    routers["async"] = router
+    if executor:
+        executor.shutdown(wait=False)
+    executor = ThreadPoolExecutor(max_workers=worker_threads, thread_name_prefix='tool-calls')
+    limiter = asyncio.Semaphore(max_concurrency)
+    request_timeout = timeout
+    # Quart cuts responses, streams included, and request bodies off after 60s by default
+    app.config["RESPONSE_TIMEOUT"] = timeout
+    app.config["BODY_TIMEOUT"] = timeout
+    max_pending = max_pending_requests
+    logger.info(f"Configured async OpenAI clients for {', '.join(u.name for u in upstreams)} "
+                f"(pool: {max_connections}, concurrency: {max_concurrency})")
+
+# Set default configuration
+configure_async_server("YOUR_API_KEY", "http://0.0.0.0:4000/v1")
+
+def is_timeout(error: Exception) -> bool:
+    # Already imported when an upstream call raised the error
+    import openai
+    return isinstance(error, openai.APITimeoutError)
+
+class OverloadedError(Exception):
+    """Raised when too many requests are already waiting for an upstream slot"""
+
+async def acquire_slot():
+    """
+    Takes one of the max_concurrency upstream slots, waiting for one when all are busy
+    and rejecting the request when max_pending requests are already waiting
+    """
+    global waiting
+    if not limiter.locked():
+        await limiter.acquire()
+        return
+    if waiting >= max_pending:
+        raise OverloadedError("Too many pending requests, retry later")
+
+    waiting += 1
+    try:
+        await limiter.acquire()
+    finally:
+        waiting -= 1
+
+@asynccontextmanager
+async def upstream_slot():
+    """Holds an upstream slot for the duration of the block"""
+    await acquire_slot()
+    try:
+        yield
+    finally:
+        limiter.release()
+
+async def run_blocking(fn, *args):
+    """Runs CPU-bound or blocking work on the executor so it never stalls the event loop"""
+    # Carry the request's context (e.g. its trace) over to the worker thread
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(context.run, fn, *args))
+
+async def open_stream(chat, messages: list[dict]):
+    """
+    Takes an upstream slot and opens the upstream stream, before any header is sent
+    so that overload and upstream errors are answered with their status code
+    """
+    await acquire_slot()
+    try:
+        with span("upstream"):
+            return await router.acreate(
+                chat.model,
+                messages,
+                **upstream_params(chat)
+            )
+    except BaseException:
+        limiter.release()
+        raise
+
+async def stream_completion(response, tools: list[dict]):
+    """Forwards the upstream stream, emitting tool calls as they complete"""
+    stream = ToolCallStream(tools)
+    try:
+        async for chunk in response:
+            if stream.may_resolve(chunk):
+                events = await run_blocking(stream.process, chunk)
+            else:
+                events = stream.process(chunk)
+            for event in events:
+                yield event
+        yield SSE_DONE
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band like OpenAI does
+        logger.error(f"Streaming error: {str(e)}")
+        yield sse_event({'error': {'message': str(e)}})
+
+class StreamBody:
+    """
+    Body of a streaming response, closing the upstream stream and giving its slot back
+    once the response is done, even when the client went away before the first event
+    """
+
+    def __init__(self, response, tools: list[dict]):
+        self.response = response
+        self.events = stream_completion(response, tools)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        return await self.events.__anext__()
+
+    async def aclose(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            await self.events.aclose()
+            await self.response.aclose()
+        finally:
+            limiter.release()
+
+async def speculative_completion(chat, messages: list[dict]):
+    """Asynchronous version of core.api.speculative_completion"""
+    collector = await run_blocking(SpeculativeToolCalls, chat.tools)
+    async with upstream_slot():
+        with span("upstream"):
+            response = await router.acreate(
+                chat.model,
+                messages,
+                **{**upstream_params(chat), **SPECULATIVE_STREAM}
+            )
+            async for chunk in response:
+                collector.feed(chunk)
+
+    return collector.completion(), await run_blocking(collector.tool_calls)
+
+def json_response(body: dict) -> Response:
+    """Asynchronous server version of core.api.json_response"""
+    return Response(encode_json(body), mimetype="application/json")
+
+@app.route("/chat/completions", methods=["POST"])
+async def chat():
+    """Asynchronous version of core.api.chat"""
+    trace = Trace(request.headers.get("X-Request-ID")) if api.trace_requests else None
+    current_trace.set(trace)
+    try:
+        chat, messages = await run_blocking(prepare_request, await request.get_data())
+
+        if chat.stream:
+            response = await open_stream(chat, messages)
+            result = Response(StreamBody(response, chat.tools), mimetype="text/event-stream")
+            return with_trace_headers(with_tool_selection_headers(result, chat), trace)
+
+        with span("cache"):
+            cache_key = response_cache_key(chat, messages)
+        cached = await run_blocking(response_cache.cache.get, cache_key) if cache_key else None
+        if cached:
+            result = json_response(with_fresh_tool_call_ids(cached))
+            result.headers["X-Cache"] = "HIT"
+            return with_trace_headers(with_tool_selection_headers(result, chat), trace)
+
+        if api.speculative_tool_calls:
+            response, tool_calls = await speculative_completion(chat, messages)
+        else:
+            async with upstream_slot():
+                with span("upstream"):
+                    response = await router.acreate(
+                        chat.model,
+                        messages,
+                        **upstream_params(chat)
+                    )
+
+            tool_calls = await run_blocking(resolve_tool_calls, response.choices[0].message.content, chat.tools)
+
+        with span("serialize"):
+            body = completion_body(response, tool_calls)
+            result = json_response(body)
+        if cache_key:
+            await run_blocking(response_cache.cache.set, cache_key, body)
+        return with_trace_headers(with_tool_selection_headers(result, chat), trace)
+
+    except OverloadedError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    except UnknownToolSet as e:
+        return with_trace_headers(jsonify({"error": e.args[0]}), trace), 404
+    except InvalidToolSet as e:
+        return with_trace_headers(jsonify({"error": str(e)}), trace), 400
+    except Exception as e:
+        if is_timeout(e):
+            logger.error(f"Upstream timed out after {request_timeout}s")
+            return jsonify({"error": "Upstream request timed out"}), 504
+        logger.error(f"API error: {str(e)}")
+        return with_trace_headers(jsonify({"error": str(e)}), trace), 500
+
+@app.route("/tools", methods=["POST"])
+async def post_tools():
+    """Asynchronous version of core.api.post_tools"""
+    body, status = await run_blocking(register_tools, await request.get_json(silent=True))
+    return jsonify(body), status
+
+@app.route("/tools/<tool_set_id>", methods=["GET"])
+async def get_tools(tool_set_id: str):
+    body, status = describe_tools(tool_set_id)
+    return jsonify(body), status
+
+@app.route("/tools/<tool_set_id>", methods=["DELETE"])
+async def delete_tools(tool_set_id: str):
+    body, status = unregister_tools(tool_set_id)
+    return jsonify(body), status
+
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,90 @@
+from dataclasses import dataclass
+from typing import Optional
+from models.schemas import Message
+from utils.metrics import counter
+
+tool_results_truncated = counter('tool_results_truncated_total', 'Tool results shortened to the maximum tool result size')
+tool_result_bytes_removed = counter('tool_result_bytes_removed_total', 'Bytes cut out of oversized tool results')
+
+
+@dataclass
+class ToolResultPolicy:
+    """
+    Bounds the size of tool results sent upstream: results above max_bytes keep their
+    head and tail (tail_fraction of the budget) around a marker recording the byte counts
+    """
+    max_bytes: Optional[int] = None
+    tail_fraction: float = 0.25
+
+    def apply(self, content: str) -> str:
+        if not self.max_bytes or len(content) <= self.max_bytes // 4:
+            # At most 4 bytes per character: short strings can't exceed the limit
+            return content
+        data = content.encode('utf-8')
+        if len(data) <= self.max_bytes:
+            return content
+
+        tail_size = int(self.max_bytes * self.tail_fraction)
+        head_size = self.max_bytes - tail_size
+        removed = len(data) - head_size - tail_size
+        tool_results_truncated.inc()
+        tool_result_bytes_removed.inc(removed)
+
+        # Cuts may split a multi-byte character, drop the partial bytes
+        head = data[:head_size].decode('utf-8', errors='ignore')
+        tail = data[len(data) - tail_size:].decode('utf-8', errors='ignore') if tail_size else ""
+        return f"{head}\n[... {removed} of {len(data)} bytes truncated ...]\n{tail}"
+
+
+tool_result_policy = ToolResultPolicy()
+
+
+def configure_tool_results(max_bytes: Optional[int] = None, tail_fraction: float = 0.25):
+    """Sets the size above which tool results are truncated, None to send them whole"""
+    global tool_result_policy
+    tool_result_policy = ToolResultPolicy(max_bytes, tail_fraction)
+
+
+def tool_result_text(message: Message, policy: ToolResultPolicy) -> str:
+    return f"Tool message received - Function: {message.name}, Result: {policy.apply(message.content)}"
+
+
+def normalize_messages(messages: list[Message], policy: Optional[ToolResultPolicy] = None) -> list[Message]:
+    """
+    Combines tool messages into user messages for models without a tool role, in a single pass
+
+    A run of tool messages is appended to the preceding user message, or becomes a new
+    user message. Contents are gathered as parts and joined once per output message,
+    and the input messages are left untouched.
+    """
+    policy = policy or tool_result_policy
+    # (role, parts, original message when it needs no rewrite)
+    folded: list[tuple[str, list[str], Optional[Message]]] = []
+    tool_parts: list[str] = []
+
+    def flush_tool_parts(at_end: bool):
+        combined = "\n".join(tool_parts)
+        tool_parts.clear()
+        if not at_end and folded and folded[-1][0] == "user":
+            role, parts, _ = folded[-1]
+            parts.append(combined)
+            folded[-1] = (role, parts, None)
+        else:
+            folded.append(("user", [combined], None))
+
+    for message in messages:
+        if message.role == "tool":
+            tool_parts.append(tool_result_text(message, policy))
+            continue
+        if tool_parts:
+            flush_tool_parts(at_end=False)
+        folded.append((message.role, [message.content], message))
+
+    # Trailing tool messages always become a new user message, even after a user message
+    if tool_parts:
+        flush_tool_parts(at_end=True)
+
+    return [
+        original if original is not None else Message.model_construct(role=role, content="\n\n".join(parts))
+        for role, parts, original in folded
+    ]
@@ -0,0 +1,71 @@
+from typing import Optional
+from models.schemas import Message
+from utils.cache import LRUCache
+from utils.code_generation import get_code, get_fn_names, get_fn_call_example_str, tools_fingerprint
+
+
+def render_system_prompt_suffix(tools: list[dict]) -> str:
+    """Renders the system prompt section describing the available tools"""
+    # Generate code for tools and create enhanced system prompt
+    code = get_code(tools)
+    
+    # Create example snippets for tool usage
+    dblnl = "\n\nand/or\n\n"
+    snippets = [f'```python\n{get_fn_call_example_str(tool["function"])}\n```' for tool in tools]
+
+    # Build system prompt with tool information
+    return f"""You have access to the following function and model:
+
+```python
+{code}
+```
+
+After analyzing the user request that will follow, you can call any of {{{get_fn_names(tools)}}} function with your evaluation. For each function call you decide to make, format your response as a Python code block using triple backticks containing the function call. Be logical and smart about which function call you make. Each function call you make will be executed and the result shown to you in this thread. It is up to you to call the functions in any order to best accomplish the task you've been given. If any function call you want to make necessitates the use of an output of another function, you can call the other function first and only that one. Or you can call many functions to get results in parallel in next message in this thread. The functions you decide to call now will have an impact on the planning and orchestration of the task. Take time to reflect on proper order of function calls and only do the ones that don't have unawaited dependencies.
+
+DO NOT MAKE UP FIELDS NOT DEFINED IN THE MODEL.
+DO NOT ASSIGN VARIABLES, DO NOT PRINT, DO NOT DO ANYTHING WITH SIDE EFFECTS. PURE CODE ONLY. SIMPLY CALL THE FUNCTIONS WITH LITTERALS WITHOUT CAPTURING THE OUTPUT. EXAMPLES BELOW.
+
+Function call syntax and output formatting examples:
+{dblnl.join(snippets)}
+
+The arguments you call the functions with must be relevant with the provided context."""
+
+
+class PromptBuilder:
+    """
+    Assembles upstream messages, caching the rendered tool suffix per tool set fingerprint
+    so the system prompt is byte-identical across turns and upstream prefix caches hit
+    """
+
+    def __init__(self, max_size: int = 256, ttl: Optional[float] = None):
+        self.cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    def system_prompt_suffix(self, tools: list[dict], fingerprint: Optional[str] = None) -> str:
+        fingerprint = fingerprint or tools_fingerprint(tools)
+        return self.cache.get_or_set(fingerprint, lambda: render_system_prompt_suffix(tools))
+
+    def build_messages(self, messages: list[Message], tools: list[dict], fingerprint: Optional[str] = None) -> list[dict]:
+        """Prepares the upstream messages with the tool information added to the system prompt"""
+        system_prompt_tool_suffix = self.system_prompt_suffix(tools, fingerprint)
+        has_system_message = any(m.role == "system" for m in messages)
+
+        # If no system message found, create one at the beginning
+        upstream_messages = [] if has_system_message else [{"role": "system", "content": system_prompt_tool_suffix}]
+
+        # Otherwise append the suffix to every system message
+        for m in messages:
+            if m.role == "system":
+                upstream_messages.append({"role": "system", "content": f"{m.content}\n\n{system_prompt_tool_suffix}"})
+            else:
+                upstream_messages.append({"role": m.role, "content": m.content})
+
+        return upstream_messages
+
+
+prompt_builder = PromptBuilder()
+
+
+def configure_prompt_cache(max_size: int = 256, ttl: Optional[float] = None):
+    """Replaces the prompt builder with one caching up to max_size rendered tool suffixes"""
+    global prompt_builder
+    prompt_builder = PromptBuilder(max_size=max_size, ttl=ttl)
@@ -0,0 +1,482 @@
+"""
+Routing of upstream completions over several OpenAI-compatible endpoints.
+
+Every upstream tracks its outstanding requests, a moving average of its latency
+and recent latency samples. A request goes to the least busy (or, with the
+'latency' strategy, a latency-weighted random) upstream serving its model,
+failed attempts are retried on another upstream after a jittered backoff, and
+upstreams failing repeatedly are taken out of rotation until a health check or
+a single trial request, let through once the cooldown is over, succeeds. Non-streaming requests can be hedged: when the first
+attempt is slower than a percentile of its upstream's recent latencies, a second
+attempt is sent to another upstream and the first answer wins.
+"""
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Optional
+from utils.metrics import counter, gauge, histogram, label_key
+
+logger = logging.getLogger('tool_call_code_execution')
+
+STRATEGIES = ['least_outstanding', 'latency']
+
+upstream_requests = counter('upstream_requests_total', 'Upstream attempts by upstream and outcome')
+upstream_hedges = counter('upstream_hedges_total', 'Hedged upstream attempts sent, and how many of them answered first')
+upstream_seconds = histogram('upstream_latency_seconds', 'Latency of successful non-streaming upstream attempts')
+
+
+@dataclass
+class Upstream:
+    """An OpenAI-compatible endpoint along with its live routing state"""
+    base_url: str
+    api_key: str = "none"
+    models: Optional[list[str]] = None  # Models served, None for any
+    name: Optional[str] = None
+    outstanding: int = field(default=0, init=False)
+    latency: Optional[float] = field(default=None, init=False)  # Exponential moving average, in seconds
+    samples: deque = field(default_factory=lambda: deque(maxlen=256), init=False)
+    failures: int = field(default=0, init=False)  # Consecutive failures
+    open_until: float = field(default=0.0, init=False)  # Circuit open (upstream skipped) until this monotonic time
+    tripped: bool = field(default=False, init=False)  # Circuit opened, closed again by a successful request
+    trial: bool = field(default=False, init=False)  # Half-open circuit with its trial request in flight
+    client: Any = field(default=None, init=False)
+
+    def __post_init__(self):
+        self.name = self.name or self.base_url
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model in self.models
+
+    def available(self, now: float) -> bool:
+        return self.open_until <= now and not (self.tripped and self.trial)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < 20:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class RoutePolicy:
+    """How requests for a model are routed"""
+    strategy: str = 'least_outstanding'
+    retries: int = 2
+    backoff: float = 0.2  # Base delay between attempts, doubled on each retry and jittered
+    hedge_percentile: Optional[float] = None  # e.g. 0.95 to hedge requests slower than the p95
+
+
+def is_retryable(error: Exception) -> bool:
+    """Connection failures, timeouts, rate limits and server errors are worth another upstream"""
+    import openai
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class Router:
+    """
+    Picks an upstream for each request and runs it with retries, failover and optional hedging.
+    Clients are created on first use by client_factory, so the same routing serves sync and async clients.
+    """
+
+    def __init__(self, upstreams: list[Upstream], client_factory: Callable[[Upstream], Any],
+                 default_policy: Optional[RoutePolicy] = None, routes: Optional[dict[str, RoutePolicy]] = None,
+                 failure_threshold: int = 3, cooldown: float = 30.0, health_check_interval: Optional[float] = None):
+        if not upstreams:
+            raise ValueError("At least one upstream is required")
+        self.upstreams = upstreams
+        self.client_factory = client_factory
+        self.default_policy = default_policy or RoutePolicy()
+        self.routes = routes or {}
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        for policy in [self.default_policy, *self.routes.values()]:
+            if policy.strategy not in STRATEGIES:
+                raise ValueError(f"Unknown routing strategy '{policy.strategy}', expected one of {STRATEGIES}")
+        if health_check_interval:
+            threading.Thread(target=self._health_checks, args=(health_check_interval,), name='upstream-health', daemon=True).start()
+
+    def policy(self, model: str) -> RoutePolicy:
+        return self.routes.get(model, self.default_policy)
+
+    def client(self, upstream: Upstream):
+        if upstream.client is None:
+            with self._lock:
+                if upstream.client is None:
+                    upstream.client = self.client_factory(upstream)
+        return upstream.client
+
+    def pick(self, model: str, exclude: tuple = ()) -> Upstream:
+        """Chooses the upstream for the next attempt and counts it as outstanding"""
+        now = time.monotonic()
+        with self._lock:
+            serving = [u for u in self.upstreams if u.serves(model)] or self.upstreams
+            candidates = [u for u in serving if u.available(now) and u not in exclude]
+            if not candidates:
+                # Everything is failing or already tried: fall back to the least recently broken upstream
+                candidates = [min((u for u in serving if u not in exclude), default=None, key=lambda u: u.open_until)
+                              or min(serving, key=lambda u: u.open_until)]
+
+            if self.policy(model).strategy == 'latency' and len(candidates) > 1:
+                # Upstreams without samples yet get the average weight so they get a chance to be measured
+                known = [u.latency for u in candidates if u.latency]
+                default = sum(known) / len(known) if known else 1.0
+                weights = [1.0 / ((u.latency or default) * (u.outstanding + 1)) for u in candidates]
+                upstream = random.choices(candidates, weights)[0]
+            else:
+                upstream = min(candidates, key=lambda u: (u.outstanding, u.latency or 0.0))
+
+            upstream.outstanding += 1
+            if upstream.tripped:
+                # Half-open: this request is the single trial, the upstream gets no other until it completes
+                upstream.trial = True
+            if upstream.open_until > now:
+                # Picked while open because nothing else could serve it, its next trial waits another cooldown
+                upstream.open_until = now + self.cooldown
+            return upstream
+
+    def release(self, upstream: Upstream, elapsed: Optional[float] = None, error: Optional[Exception] = None):
+        """Records the outcome of an attempt"""
+        with self._lock:
+            upstream.outstanding -= 1
+            if error is None:
+                upstream.failures = 0
+                upstream.open_until = 0.0
+                upstream.tripped = upstream.trial = False
+                if elapsed is not None:
+                    upstream.samples.append(elapsed)
+                    upstream.latency = elapsed if upstream.latency is None else 0.8 * upstream.latency + 0.2 * elapsed
+            elif is_retryable(error):
+                upstream.failures += 1
+                if upstream.failures >= self.failure_threshold:
+                    upstream.open_until = time.monotonic() + self.cooldown
+                    upstream.tripped, upstream.trial = True, False
+                    logger.warning(f"Upstream {upstream.name} failed {upstream.failures} times, skipping it for {self.cooldown}s")
+            else:
+                # Says nothing about the upstream, the next request is another trial
+                upstream.trial = False
+        upstream_requests.inc(upstream=upstream.name, outcome="success" if error is None else "error")
+        if error is None and elapsed is not None:
+            upstream_seconds.observe(elapsed, upstream=upstream.name)
+
+    def abandon(self, upstream: Upstream, in_flight: bool = False):
+        """
+        Takes back a pick whose attempt was never sent or was cancelled, saying nothing about the upstream.
+        in_flight is True when another attempt on the upstream is still running, and may be its trial
+        """
+        with self._lock:
+            upstream.outstanding -= 1
+            if not in_flight:
+                upstream.trial = False
+
+    def backoff(self, policy: RoutePolicy, attempt: int) -> float:
+        # Full jitter: spreads the retries of concurrent requests failing together
+        return random.uniform(0, policy.backoff * (2 ** attempt))
+
+    # Synchronous clients
+
+    def create(self, model: str, messages: list[dict], **params):
+        """chat.completions.create on the routed upstream(s)"""
+        policy = self.policy(model)
+        tried = ()
+        for attempt in range(policy.retries + 1):
+            try:
+                if params.get('stream'):
+                    upstream = self.pick(model, tried)
+                    tried += (upstream,)
+                    return self._stream(upstream, model, messages, params)
+                if policy.hedge_percentile and len(self.upstreams) > 1:
+                    return self._hedged(policy, model, messages, params)
+                upstream = self.pick(model, tried)
+                tried += (upstream,)
+                return self._attempt(upstream, model, messages, params)
+            except Exception as e:
+                if attempt == policy.retries or not is_retryable(e):
+                    raise
+                upstream_requests.inc(upstream=tried[-1].name if tried else "hedged", outcome="retry")
+                time.sleep(self.backoff(policy, attempt))
+
+    def _attempt(self, upstream: Upstream, model: str, messages: list[dict], params: dict):
+        start = time.perf_counter()
+        try:
+            response = self.client(upstream).chat.completions.create(model=model, messages=messages, **params)
+        except Exception as e:
+            self.release(upstream, error=e)
+            raise
+        self.release(upstream, time.perf_counter() - start)
+        return response
+
+    def _stream(self, upstream: Upstream, model: str, messages: list[dict], params: dict):
+        try:
+            response = self.client(upstream).chat.completions.create(model=model, messages=messages, **params)
+        except Exception as e:
+            self.release(upstream, error=e)
+            raise
+
+        return RoutedStream(self, upstream, response)
+
+    def _start_attempt(self, upstream: Upstream, model: str, messages: list[dict], params: dict) -> tuple[Future, threading.Event]:
+        """
+        Runs an attempt on a thread of its own, so hedged requests aren't capped by a pool size
+        and wait in no queue. Returns its future and an event set once it is sent
+        """
+        future, started = Future(), threading.Event()
+
+        def run():
+            future.set_running_or_notify_cancel()
+            started.set()
+            try:
+                future.set_result(self._attempt(upstream, model, messages, params))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name='upstream-attempt', daemon=True).start()
+        return future, started
+
+    def _hedged(self, policy: RoutePolicy, model: str, messages: list[dict], params: dict):
+        primary = self.pick(model)
+        future, started = self._start_attempt(primary, model, messages, params)
+        futures = {future: primary}
+        # The hedge delay counts from when the first attempt is actually sent
+        started.wait()
+        done, _ = wait(futures, timeout=primary.percentile(policy.hedge_percentile), return_when=FIRST_COMPLETED)
+        if not done:
+            secondary = self.pick(model, (primary,))
+            if secondary is not primary:
+                upstream_hedges.inc(outcome="sent")
+                futures[self._start_attempt(secondary, model, messages, params)[0]] = secondary
+            else:
+                # Nothing else serves the model, the primary attempt is the only one
+                self.abandon(secondary, in_flight=True)
+
+        # The first successful answer wins, the other attempt completes in the background
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if futures[future] is not primary:
+                        upstream_hedges.inc(outcome="won")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    # Asynchronous clients
+
+    async def acreate(self, model: str, messages: list[dict], **params):
+        """Asynchronous version of create, for routers built with AsyncOpenAI clients"""
+        policy = self.policy(model)
+        tried = ()
+        for attempt in range(policy.retries + 1):
+            try:
+                if params.get('stream'):
+                    upstream = self.pick(model, tried)
+                    tried += (upstream,)
+                    return await self._astream(upstream, model, messages, params)
+                if policy.hedge_percentile and len(self.upstreams) > 1:
+                    return await self._ahedged(policy, model, messages, params)
+                upstream = self.pick(model, tried)
+                tried += (upstream,)
+                return await self._aattempt(upstream, model, messages, params)
+            except Exception as e:
+                if attempt == policy.retries or not is_retryable(e):
+                    raise
+                upstream_requests.inc(upstream=tried[-1].name if tried else "hedged", outcome="retry")
+                await asyncio.sleep(self.backoff(policy, attempt))
+
+    async def _aattempt(self, upstream: Upstream, model: str, messages: list[dict], params: dict):
+        start = time.perf_counter()
+        try:
+            response = await self.client(upstream).chat.completions.create(model=model, messages=messages, **params)
+        except asyncio.CancelledError:
+            # Losing hedged attempt, its outcome says nothing about the upstream
+            self.abandon(upstream)
+            raise
+        except Exception as e:
+            self.release(upstream, error=e)
+            raise
+        self.release(upstream, time.perf_counter() - start)
+        return response
+
+    async def _astream(self, upstream: Upstream, model: str, messages: list[dict], params: dict):
+        try:
+            response = await self.client(upstream).chat.completions.create(model=model, messages=messages, **params)
+        except Exception as e:
+            self.release(upstream, error=e)
+            raise
+
+        return AsyncRoutedStream(self, upstream, response)
+
+    async def _ahedged(self, policy: RoutePolicy, model: str, messages: list[dict], params: dict):
+        primary = self.pick(model)
+        tasks = {asyncio.ensure_future(self._aattempt(primary, model, messages, params)): primary}
+        done, _ = await asyncio.wait(tasks, timeout=primary.percentile(policy.hedge_percentile))
+        if not done:
+            secondary = self.pick(model, (primary,))
+            if secondary is not primary:
+                upstream_hedges.inc(outcome="sent")
+                tasks[asyncio.ensure_future(self._aattempt(secondary, model, messages, params))] = secondary
+            else:
+                # Nothing else serves the model, the primary attempt is the only one
+                self.abandon(secondary, in_flight=True)
+
+        pending = set(tasks)
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if tasks[task] is not primary:
+                            upstream_hedges.inc(outcome="won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Unlike threads, the losing attempt can be cancelled
+            for task in pending:
+                task.cancel()
+
+    # Health checks
+
+    def _health_checks(self, interval: float):
+        import httpx
+        while not self._stopped.wait(interval):
+            for upstream in self.upstreams:
+                if upstream.failures == 0:
+                    continue
+                try:
+                    response = httpx.get(upstream.base_url.rstrip('/') + '/models', timeout=5.0,
+                                         headers={"Authorization": f"Bearer {upstream.api_key}"})
+                    healthy = response.status_code < 500
+                except httpx.HTTPError:
+                    healthy = False
+                if healthy:
+                    with self._lock:
+                        upstream.failures = 0
+                        upstream.open_until = 0.0
+                        upstream.tripped = upstream.trial = False
+                    logger.info(f"Upstream {upstream.name} is healthy again")
+
+    def close(self):
+        self._stopped.set()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        stats = {}
+        for upstream in self.upstreams:
+            for stat, value in (("outstanding", upstream.outstanding), ("latency", upstream.latency or 0.0),
+                                ("available", int(upstream.available(now)))):
+                stats[label_key({"upstream": upstream.name, "stat": stat})] = value
+        return stats
+
+
+class RoutedStream:
+    """
+    Upstream completion stream keeping its upstream outstanding until it is exhausted, fails
+    or is closed. Closing it releases the upstream and closes the upstream connection even
+    when it was never iterated, e.g. when the client went away before the first chunk.
+    """
+
+    def __init__(self, router: Router, upstream: Upstream, response):
+        self.router = router
+        self.upstream = upstream
+        self.response = response
+        self._chunks = iter(response)
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            self.close()
+            raise
+        except Exception as e:
+            self.close(e)
+            raise
+
+    def close(self, error: Optional[Exception] = None):
+        if self._closed:
+            return
+        self._closed = True
+        self.router.release(self.upstream, error=error)
+        if hasattr(self.response, 'close'):
+            self.response.close()
+
+
+class AsyncRoutedStream:
+    """Asynchronous version of RoutedStream"""
+
+    def __init__(self, router: Router, upstream: Upstream, response):
+        self.router = router
+        self.upstream = upstream
+        self.response = response
+        self._chunks = response.__aiter__()
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            await self.aclose()
+            raise
+        except Exception as e:
+            await self.aclose(e)
+            raise
+
+    async def aclose(self, error: Optional[Exception] = None):
+        if self._closed:
+            return
+        self._closed = True
+        self.router.release(self.upstream, error=error)
+        if hasattr(self.response, 'close'):
+            await self.response.close()
+
+
+def load_upstreams(path: str, default_policy: Optional[RoutePolicy] = None) -> tuple[list[Upstream], dict[str, RoutePolicy]]:
+    """
+    Reads upstreams and per-model routes, overriding fields of default_policy, from a JSON file like:
+
+        {"upstreams": [{"base_url": "http://10.0.0.1:8000/v1", "api_key": "...", "models": ["llama"]}, ...],
+         "routes": {"llama": {"strategy": "latency", "hedge_percentile": 0.95}}}
+
+    or just the list of upstreams.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    if isinstance(config, list):
+        config = {"upstreams": config}
+    upstreams = [Upstream(**spec) for spec in config["upstreams"]]
+    default_policy = default_policy or RoutePolicy()
+    routes = {model: replace(default_policy, **policy) for model, policy in config.get("routes", {}).items()}
+    return upstreams, routes
+
+
+# Routers registered by the servers, exported as one gauge
+routers: dict[str, Router] = {}
+
+
+def router_stats() -> dict:
+    stats = {}
+    for router in list(routers.values()):
+        stats.update(router.stats())
+    return stats
+
+
+gauge('upstream_state', 'Outstanding requests, latency moving average and availability of each upstream', router_stats)
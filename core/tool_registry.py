@@ -0,0 +1,138 @@
+"""
+Registry of tool sets and their precompiled artifacts.
+
+Tool sets registered with POST /tools are kept until deleted, and requests can
+name them by ID in place of an inline tools array. Inline tool arrays are
+interned by content hash in a bounded cache, so identical arrays sent by many
+requests share one list and one set of artifacts. IDs are derived from the
+content hash: registering the same tools again, e.g. after a restart, returns
+the same ID, and the ID of an inline tool set is the one it would be registered under.
+"""
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Optional
+from core import prompt
+from utils import code_generation
+from utils.cache import LRUCache
+from utils.code_generation import CompiledTools, FingerprintedTools, get_compiled_tools, tools_fingerprint
+from utils.metrics import counter, gauge, label_key
+
+ID_PREFIX = 'ts_'
+
+tool_set_lookups = counter('tool_set_lookups_total', 'Tool sets resolved for requests, by how they were sent and found')
+
+
+class UnknownToolSet(KeyError):
+    """Raised when a request names a tool set that isn't registered"""
+
+
+class InvalidToolSet(ValueError):
+    """Raised when a tool set can't be compiled"""
+
+
+def tool_set_id(fingerprint: str) -> str:
+    return ID_PREFIX + fingerprint[:32]
+
+
+@dataclass
+class ToolSet:
+    """A tool list along with everything the request pipeline derives from it"""
+    id: str
+    tools: FingerprintedTools
+    models: CompiledTools  # Stubs shown in the prompt
+    compiled: CompiledTools  # Stubs returning their arguments, used to resolve tool calls
+    prompt_suffix: str
+
+    @property
+    def names(self) -> dict[str, str]:
+        """Tool function name -> name of its arguments model"""
+        return self.compiled.tool_models
+
+    @classmethod
+    def build(cls, tools: list[dict], fingerprint: Optional[str] = None) -> "ToolSet":
+        if not isinstance(tools, list) or not all(isinstance(tool, dict) and 'function' in tool for tool in tools):
+            raise InvalidToolSet("Tools must be a list of {\"type\": \"function\", \"function\": {...}} objects")
+        tools = FingerprintedTools(tools, fingerprint or tools_fingerprint(tools))
+        try:
+            models = get_compiled_tools(tools)
+            compiled = get_compiled_tools(tools, return_args=True)
+            suffix = prompt.prompt_builder.system_prompt_suffix(tools)
+        except Exception as e:
+            raise InvalidToolSet(f"Could not compile tools: {str(e)}") from e
+        return cls(tool_set_id(tools.fingerprint), tools, models, compiled, suffix)
+
+    def restore(self):
+        """Puts the artifacts back into the shared caches, in case they were evicted since"""
+        fingerprint = self.tools.fingerprint
+        for return_args, compiled in ((False, self.models), (True, self.compiled)):
+            if (fingerprint, return_args) not in code_generation.code_cache:
+                sys.modules[compiled.module.__name__] = compiled.module
+                code_generation.code_cache.set((fingerprint, return_args), compiled)
+        if fingerprint not in prompt.prompt_builder.cache:
+            prompt.prompt_builder.cache.set(fingerprint, self.prompt_suffix)
+
+
+class ToolRegistry:
+    """Registered tool sets, kept until deleted, and inline ones interned in an LRU cache"""
+
+    def __init__(self, max_interned: int = 256):
+        self.registered: dict[str, ToolSet] = {}
+        self.interned = LRUCache(max_size=max_interned)
+        self._lock = threading.Lock()
+
+    def register(self, tools: list[dict]) -> ToolSet:
+        """Registers a tool set, returning the already registered one when the content is the same"""
+        fingerprint = tools_fingerprint(tools)
+        identifier = tool_set_id(fingerprint)
+        tool_set = self.registered.get(identifier) or self.interned.get(identifier) or ToolSet.build(tools, fingerprint)
+        with self._lock:
+            return self.registered.setdefault(identifier, tool_set)
+
+    def unregister(self, identifier: str) -> bool:
+        with self._lock:
+            return self.registered.pop(identifier, None) is not None
+
+    def get(self, identifier: str) -> ToolSet:
+        tool_set = self.registered.get(identifier) or self.interned.get(identifier)
+        if tool_set is None:
+            raise UnknownToolSet(f"Unknown tool set '{identifier}', register it with POST /tools")
+        return tool_set
+
+    def intern(self, tools: list[dict]) -> ToolSet:
+        """Returns the tool set of an inline tools array, building its artifacts on first sight"""
+        fingerprint = tools_fingerprint(tools)
+        identifier = tool_set_id(fingerprint)
+        tool_set = self.registered.get(identifier)
+        if tool_set is not None:
+            return tool_set
+        return self.interned.get_or_set(identifier, lambda: ToolSet.build(tools, fingerprint))
+
+    def resolve(self, tools: list[dict] | str) -> ToolSet:
+        """Returns the tool set of a request, named by ID or sent inline"""
+        if isinstance(tools, str):
+            tool_set = self.get(tools)
+            tool_set_lookups.inc(source="id")
+        else:
+            tool_set = self.intern(tools)
+            tool_set_lookups.inc(source="inline")
+        tool_set.restore()
+        return tool_set
+
+    def stats(self) -> dict:
+        return {"registered": len(self.registered), "interned": len(self.interned)}
+
+
+registry = ToolRegistry()
+
+
+def configure_tool_registry(max_interned: int = 256):
+    """Sets how many inline tool sets are interned, registered ones are kept regardless"""
+    global registry
+    registered = registry.registered
+    registry = ToolRegistry(max_interned)
+    registry.registered.update(registered)
+
+
+gauge('tool_sets', 'Tool sets registered with POST /tools and inline tool sets interned',
+      lambda: {label_key({"kind": kind}): value for kind, value in registry.stats().items()})
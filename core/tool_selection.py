@@ -0,0 +1,154 @@
+"""
+Selection of the tools shown to the model for large tool sets.
+
+Every tool adds its generated models and a call example to the system prompt,
+which amounts to thousands of tokens for toolboxes of 50+ tools. When enabled,
+the tools of a request are ranked against its recent messages with BM25 over
+tool names and descriptions, and only the top_k tools, plus the tools whose
+results appear in recent tool messages, are sent. The subset is the tool set of
+the request from then on: it is what the model sees and what its tool calls are
+validated against. The lexical index is built once per tool set and cached, and
+subsets are cached apart from the interned tool sets so they don't evict them.
+"""
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+from core.tool_registry import ToolSet
+from models.schemas import Message
+from utils.cache import LRUCache
+from utils.metrics import counter, histogram
+
+logger = logging.getLogger('tool_call_code_execution')
+
+tools_selected = counter('tools_selected_total', 'Tools sent to the model and left out by tool selection, by outcome')
+prompt_tokens_saved = histogram('prompt_tokens_saved', 'Estimated prompt tokens saved per request by tool selection',
+                                buckets=(0, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000))
+
+# Splits snake_case, camelCase and plain words alike
+WORD_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+# Rough size of a token in English text and code
+CHARS_PER_TOKEN = 4
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased words of a text, with a plural 's' dropped so 'files' matches 'file'"""
+    terms = []
+    for word in WORD_PATTERN.findall(text):
+        word = word.lower()
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def tool_terms(tool: dict) -> list[str]:
+    """Terms of a tool's name and description and of its parameters' names and descriptions"""
+    function = tool['function']
+    parts = [function['name'], function.get('description') or '']
+    for name, schema in (function.get('parameters') or {}).get('properties', {}).items():
+        parts.append(name)
+        if isinstance(schema, dict):
+            parts.append(schema.get('description') or '')
+    return tokenize(" ".join(parts))
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of documents, given as lists of terms"""
+
+    def __init__(self, documents: list[list[str]], k1: float = 1.2, b: float = 0.75):
+        self.size = len(documents)
+        average_length = sum(len(document) for document in documents) / max(self.size, 1) or 1.0
+        # term -> [(document index, term weight)], with the length normalization folded in
+        self.postings: dict[str, list[tuple[int, float]]] = {}
+        for index, document in enumerate(documents):
+            norm = k1 * (1 - b + b * len(document) / average_length)
+            for term, frequency in Counter(document).items():
+                self.postings.setdefault(term, []).append((index, frequency * (k1 + 1) / (frequency + norm)))
+        self.idf = {
+            term: math.log(1 + (self.size - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def scores(self, query: list[str]) -> list[float]:
+        scores = [0.0] * self.size
+        for term in set(query):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for index, weight in self.postings[term]:
+                scores[index] += idf * weight
+        return scores
+
+
+@dataclass
+class Selection:
+    tool_set: ToolSet
+    tokens_saved: int
+
+
+class ToolSelector:
+    """
+    Narrows tool sets of more than top_k tools down to the top_k tools most relevant to
+    the last `window` messages, keeping the tools named by tool messages among them
+    """
+
+    def __init__(self, top_k: int = 10, window: int = 4, max_indexes: int = 256, max_subsets: int = 256):
+        self.top_k = top_k
+        self.window = window
+        self.indexes = LRUCache(max_size=max_indexes)
+        self.subsets = LRUCache(max_size=max_subsets)
+
+    def index(self, tool_set: ToolSet) -> BM25Index:
+        return self.indexes.get_or_set(tool_set.tools.fingerprint,
+                                       lambda: BM25Index([tool_terms(tool) for tool in tool_set.tools]))
+
+    def select(self, tool_set: ToolSet, messages: list[Message]) -> Optional[Selection]:
+        """
+        Returns the subset of tools to send and the prompt tokens it saves,
+        or None when the whole tool set should be sent
+        """
+        tools = tool_set.tools
+        if len(tools) <= self.top_k:
+            return None
+
+        recent = [message for message in messages if message.role != "system"][-self.window:]
+        used = {message.name for message in recent if message.role == "tool" and message.name}
+        scores = self.index(tool_set).scores(tokenize(" ".join(message.content for message in recent)))
+
+        ranked = sorted((index for index, score in enumerate(scores) if score > 0), key=lambda index: -scores[index])
+        chosen = set(ranked[:self.top_k])
+        chosen.update(index for index, tool in enumerate(tools) if tool['function']['name'] in used)
+        if not chosen or len(chosen) >= len(tools):
+            # Nothing to go on, or nothing to leave out
+            return None
+
+        # Tools keep their order so the same selection renders the same prompt
+        chosen = tuple(sorted(chosen))
+        subset = self.subsets.get_or_set((tools.fingerprint, chosen), lambda: ToolSet.build([tools[index] for index in chosen]))
+        subset.restore()
+        system_messages = max(1, sum(message.role == "system" for message in messages))
+        saved = (estimate_tokens(tool_set.prompt_suffix) - estimate_tokens(subset.prompt_suffix)) * system_messages
+
+        tools_selected.inc(len(chosen), outcome="sent")
+        tools_selected.inc(len(tools) - len(chosen), outcome="left_out")
+        prompt_tokens_saved.observe(saved)
+        logger.info(f"Selected {len(chosen)} of {len(tools)} tools, saving ~{saved} prompt tokens")
+        return Selection(subset, saved)
+
+
+# Disabled unless configured
+selector: Optional[ToolSelector] = None
+
+
+def configure_tool_selection(top_k: Optional[int] = None, window: int = 4):
+    """Sends at most top_k tools ranked against the last window messages, None to always send every tool"""
+    global selector
+    selector = ToolSelector(top_k, window) if top_k else None
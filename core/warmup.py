@@ -0,0 +1,63 @@
+import gc
+import importlib
+import logging
+import threading
+import time
+from core import api, tool_registry
+from utils.disk_cache import load_tool_sets
+
+logger = logging.getLogger('tool_call_code_execution')
+
+# Dependencies imported on first use rather than when the server starts
+HEAVY_MODULES = (
+    'openai',
+    'datamodel_code_generator.model',
+    'datamodel_code_generator.parser.jsonschema',
+    'isort',
+    'astor',
+)
+
+# Only needed by the kernel executor
+KERNEL_MODULES = ('jupyter_client', 'nbformat', 'nbconvert.preprocessors')
+
+
+def warm_up(tool_sets: list[list[dict]] = (), modules: tuple = HEAVY_MODULES):
+    """
+    Imports the heavy dependencies, creates the upstream clients and generates the
+    code and prompt of the given tool sets, so the first requests don't pay for them
+    """
+    start = time.perf_counter()
+    for name in modules:
+        importlib.import_module(name)
+    for upstream in api.router.upstreams:
+        try:
+            api.router.client(upstream)
+        except Exception as e:
+            # Requests will report the same error, the rest of the warm-up is still useful
+            logger.warning(f"Could not create the client of upstream {upstream.name}: {str(e)}")
+
+    for tools in tool_sets:
+        tool_registry.registry.intern(tools)
+
+    logger.info(f"Warmed up {len(modules)} modules and {len(tool_sets)} tool sets in {time.perf_counter() - start:.2f}s")
+
+
+def start_background_warm_up(modules: tuple = HEAVY_MODULES, tool_sets_path: str | None = None) -> threading.Thread:
+    """Warms up on a background thread, letting the server accept requests right away"""
+    def run():
+        warm_up(load_tool_sets(tool_sets_path) if tool_sets_path else [], modules)
+
+    thread = threading.Thread(target=run, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def preload(tool_sets_path: str | None = None, modules: tuple = HEAVY_MODULES):
+    """
+    Warms up synchronously before workers are forked (see wsgi.py), then freezes the
+    heap so the garbage collector doesn't touch, and thereby copy, the pages the
+    workers share with the parent
+    """
+    warm_up(load_tool_sets(tool_sets_path) if tool_sets_path else [], modules)
+    gc.collect()
+    gc.freeze()
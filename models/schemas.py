@@ -1,5 +1,5 @@
 from typing import List, Literal, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 class Message(BaseModel):
     """Represents a single message in the chat conversation"""
@@ -18,4 +18,5 @@ class OpenAIRequest(BaseModel):
     frequency_penalty: Optional[float] = None
     user: Optional[str] = None
     stream: Optional[bool] = None
-    tools: Optional[list[dict]]  # Tool definitions following OpenAI's format 
\ No newline at end of file
+    tools: Optional[list[dict] | str]  # Tool definitions following OpenAI's format, or the ID of a registered tool set 
+    _prompt_tokens_saved: Optional[int] = PrivateAttr(default=None)  # Estimated by tool selection, when it left tools out
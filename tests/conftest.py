@@ -0,0 +1,10 @@
+import pytest
+
+from utils.request_log import configure_request_log
+
+
+@pytest.fixture(autouse=True)
+def no_request_log():
+    """Keeps the servers from appending test requests to requests.jsonl"""
+    configure_request_log(None)
+    yield
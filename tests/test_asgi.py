@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletionChunk
+
+from core import asgi
+from core.router import Router, Upstream
+
+CONTENT = 'Checking.\n```python\nget_weather(GetWeatherModel(city="Paris"))\n```'
+
+BODY = {
+    "model": "m",
+    "stream": True,
+    "messages": [{"role": "user", "content": "Weather in Paris?"}],
+    "tools": [{"type": "function", "function": {"name": "get_weather", "parameters": {
+        "type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]}}}],
+}
+
+
+class SlowCompletions:
+    """Streams CONTENT a few characters at a time, pausing between chunks"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def create(self, **kwargs):
+        async def chunks():
+            base = {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m"}
+            for start in range(0, len(CONTENT), 8):
+                await asyncio.sleep(self.delay)
+                delta = {"content": CONTENT[start:start + 8]}
+                yield ChatCompletionChunk.model_validate({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            yield ChatCompletionChunk.model_validate({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        return chunks()
+
+
+def slow_client(delay: float):
+    return SimpleNamespace(chat=SimpleNamespace(completions=SlowCompletions(delay)))
+
+
+def test_stream_outlasting_quart_default_timeout_completes():
+    async def run():
+        # Stands in for Quart's 60s default, which the request timeout must replace
+        asgi.app.config["RESPONSE_TIMEOUT"] = 0.5
+        asgi.configure_async_server("key", "http://upstream", timeout=30)
+        asgi.router = Router([Upstream("upstream")], lambda upstream: slow_client(0.1))
+        response = await asgi.app.test_client().post("/chat/completions", json=BODY)
+        return response.status_code, await response.get_data(as_text=True)
+
+    status, body = asyncio.run(run())
+    assert status == 200
+    assert '"name":"get_weather"' in body
+    assert body.endswith("data: [DONE]\n\n")
@@ -0,0 +1,54 @@
+import pytest
+
+from utils.code_execution import evaluate_expression
+from utils.code_generation import get_compiled_tools, match_tool_call
+
+AUTHORIZED_IMPORTS = ['pydantic', '__future__']
+
+TOOLS = [
+    {"type": "function", "function": {"name": "get_weather", "parameters": {
+        "type": "object", "properties": {"city": {"type": "string"}, "days": {"type": "integer"}}, "required": ["city"]}}},
+    {"type": "function", "function": {"name": "delete_file", "parameters": {
+        "type": "object", "properties": {"path": {"type": "string"}}, "required": ["path"]}}},
+]
+
+
+@pytest.fixture(scope="module")
+def compiled():
+    return get_compiled_tools(TOOLS, return_args=True)
+
+
+def evaluate(snippet, compiled, tool_name="get_weather"):
+    return evaluate_expression(snippet, tool_name, compiled.module, AUTHORIZED_IMPORTS)
+
+
+def test_evaluates_tool_call(compiled):
+    assert evaluate('get_weather(GetWeatherModel(city="Paris", days=1 + 1))', compiled) == '{"city":"Paris","days":2}'
+
+
+def test_evaluates_statements_before_the_call(compiled):
+    snippet = 'args = GetWeatherModel(city="Paris")\nargs.days = 3\nget_weather(args)'
+    assert evaluate(snippet, compiled) == '{"city":"Paris","days":3}'
+
+
+@pytest.mark.parametrize("snippet", [
+    'get_weather(GetWeatherModel(city="{0.__init__.__globals__[sys].modules[os].environ[HOME]}".format(GetWeatherModel)))',
+    'get_weather(GetWeatherModel(city="{x}".format_map({"x": 1})))',
+    'import pydantic\nget_weather(GetWeatherModel(city=pydantic.main.sys.modules["os"].environ["HOME"]))',
+    'get_weather(GetWeatherModel(city=__builtins__["str"](1)))',
+    'get_weather = GetWeatherModel\nget_weather(GetWeatherModel(city="Paris"))',
+    'from pydantic import BaseModel as GetWeatherModel\nget_weather(GetWeatherModel(city="Paris"))',
+    'args = GetWeatherModel(city="Paris")\nget_weather(GetWeatherModel(city=args.model_fields.keys))',
+])
+def test_rejects_calls_and_attributes_outside_the_tool_module(snippet, compiled):
+    with pytest.raises(ValueError):
+        evaluate(snippet, compiled)
+
+
+def test_block_with_two_tool_calls_resolves_to_the_last_one(compiled):
+    snippet = 'get_weather(GetWeatherModel(city="Paris"))\ndelete_file(DeleteFileModel(path="/etc"))'
+    match = match_tool_call(snippet, compiled.tool_models)
+    assert match.name == "delete_file"
+    assert evaluate(snippet, compiled, match.name) == '{"path":"/etc"}'
+    with pytest.raises(SyntaxError):
+        evaluate(snippet, compiled, "get_weather")
@@ -0,0 +1,62 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from core.router import RoutePolicy, Router, Upstream
+
+
+class SlowCompletions:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def create(self, **kwargs):
+        time.sleep(self.delay)
+        return "completion"
+
+
+class AsyncSlowCompletions(SlowCompletions):
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        return "completion"
+
+
+def hedging_router(completions) -> Router:
+    """Two upstreams where only the first serves model 'm', with enough samples to hedge after 10ms"""
+    serving, other = Upstream("serving", models=["m"]), Upstream("other", models=["other"])
+    serving.samples.extend([0.01] * 20)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return Router([serving, other], lambda upstream: client, RoutePolicy(hedge_percentile=0.5))
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_hedge_without_another_upstream_leaves_nothing_outstanding(asynchronous):
+    if asynchronous:
+        router = hedging_router(AsyncSlowCompletions(0.05))
+
+        async def run():
+            return [await router.acreate("m", []) for _ in range(3)]
+        results = asyncio.run(run())
+    else:
+        router = hedging_router(SlowCompletions(0.05))
+        results = [router.create("m", []) for _ in range(3)]
+
+    assert results == ["completion"] * 3
+    assert [upstream.outstanding for upstream in router.upstreams] == [0, 0]
+
+
+def test_hedge_without_another_upstream_keeps_the_trial_in_flight():
+    router = hedging_router(AsyncSlowCompletions(0.05))
+    serving = router.upstreams[0]
+    serving.tripped = True
+
+    async def run():
+        task = asyncio.ensure_future(router.acreate("m", []))
+        await asyncio.sleep(0.03)
+        # Hedge deadline passed: the trial is still the only request let through
+        assert serving.trial and not serving.available(time.monotonic())
+        return await task
+
+    assert asyncio.run(run()) == "completion"
+    assert not serving.tripped and not serving.trial and serving.outstanding == 0
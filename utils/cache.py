@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe bounded mapping with least-recently-used eviction
+    and an optional time-to-live for every entry
+    """
+
+    def __init__(self, max_size: int = 128, ttl: Optional[float] = None,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def _lookup(self, key: Hashable):
+        """Returns the (value, expires_at) entry for key, dropping it if expired"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            self._evict(key)
+            return None
+        return entry
+
+    def _evict(self, key: Hashable):
+        value, _ = self._data.pop(key)
+        self.evictions += 1
+        if self.on_evict:
+            self.on_evict(key, value)
+
+    def get(self, key: Hashable, default: Any = None):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            expires_at = time.monotonic() + self.ttl if self.ttl else None
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._evict(next(iter(self._data)))
+
+    def get_or_set(self, key: Hashable, factory: Callable[[], Any]):
+        """Returns the cached value for key, building and storing it with factory on a miss"""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            # Build outside the lock so slow factories don't serialize unrelated lookups
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._data.items())
+            self._data.clear()
+        if self.on_evict:
+            for key, (value, _) in entries:
+                self.on_evict(key, value)
+
+    def stats(self) -> dict:
+        """Returns hit/miss/eviction counters along with the current size"""
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,67 @@
+import ast
+from typing import Any
+from pydantic import BaseModel
+from utils.code_generation import CompiledTools
+
+
+class NonLiteralCallError(ValueError):
+    """Raised when a tool call snippet cannot be resolved without executing it"""
+
+
+def literal_value(node: ast.AST, compiled: CompiledTools) -> Any:
+    """
+    Converts an AST node to a Python value, accepting literals, containers
+    and constructors of models defined in the compiled tool module
+    """
+    if isinstance(node, ast.Call):
+        return model_call_arguments(node, compiled)
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return [literal_value(element, compiled) for element in node.elts]
+    if isinstance(node, ast.Dict):
+        if any(key is None for key in node.keys):
+            raise NonLiteralCallError("Dictionary unpacking is not a literal")
+        return {literal_value(key, compiled): literal_value(value, compiled) for key, value in zip(node.keys, node.values)}
+
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        raise NonLiteralCallError(f"Expression '{ast.unparse(node)}' is not a literal")
+
+
+def model_call_arguments(node: ast.Call, compiled: CompiledTools) -> dict:
+    """Returns the keyword arguments of a model constructor call as a dict"""
+    if not isinstance(node.func, ast.Name):
+        raise NonLiteralCallError(f"Call to '{ast.unparse(node.func)}' is not a model constructor")
+
+    model = getattr(compiled.module, node.func.id, None)
+    if not (isinstance(model, type) and issubclass(model, BaseModel)):
+        raise NonLiteralCallError(f"'{node.func.id}' is not a model of this tool set")
+    if node.args or any(keyword.arg is None for keyword in node.keywords):
+        raise NonLiteralCallError(f"'{node.func.id}' must be called with keyword arguments only")
+
+    return {keyword.arg: literal_value(keyword.value, compiled) for keyword in node.keywords}
+
+
+def extract_literal_arguments(snippet: str, tool_name: str, compiled: CompiledTools) -> str:
+    """
+    Statically resolves a snippet of the form `tool(ToolModel(field=literal, ...))`
+    and validates the arguments with the tool's Pydantic model, without executing any code.
+    Returns the arguments serialized as JSON.
+    """
+    try:
+        tree = ast.parse(snippet.strip(), mode='eval')
+    except SyntaxError as e:
+        raise NonLiteralCallError(f"Snippet is not a single expression: {e}")
+
+    call = tree.body
+    if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Name) and call.func.id == tool_name):
+        raise NonLiteralCallError(f"Snippet is not a call to '{tool_name}'")
+    if len(call.args) != 1 or call.keywords or not isinstance(call.args[0], ast.Call):
+        raise NonLiteralCallError(f"'{tool_name}' must be called with a single model instance")
+
+    model_call = call.args[0]
+    if not (isinstance(model_call.func, ast.Name) and model_call.func.id == compiled.tool_models.get(tool_name)):
+        raise NonLiteralCallError(f"'{tool_name}' must be called with a {compiled.tool_models.get(tool_name)} instance")
+
+    model = getattr(compiled.module, model_call.func.id)
+    return model.model_validate(model_call_arguments(model_call, compiled)).model_dump_json()
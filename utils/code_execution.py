@@ -1,13 +1,30 @@
-import nbformat
-from nbconvert.preprocessors import ExecutePreprocessor
+import ast
+import builtins
+import enum
+import inspect
+import json
+import logging
 import tempfile
 import os
 import re
-from typing import List, Tuple, Union
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Container, List, Optional, Tuple, Union
+from pydantic import ValidationError
+from utils.code_analysis import NonLiteralCallError, extract_literal_arguments
+from utils.code_generation import CompiledTools, ToolCallMatch
+from utils.metrics import counter, histogram
+from utils.process_pool import SandboxValidationError
 
+logger = logging.getLogger('tool_call_code_execution')
 
 
 CODE_BLOCK_PATTERN = r"```[ \t]*(\w+)?[ \t]*\r?\n(.*?)\r?\n[ \t]*```"
+CODE_BLOCK_REGEX = re.compile(CODE_BLOCK_PATTERN, flags=re.DOTALL)
+# Fenced blocks or inline code, separated by the | operator
+CODE_OR_INLINE_REGEX = re.compile(CODE_BLOCK_PATTERN + r"|`([^`]+)`", flags=re.DOTALL)
 
 
 def extract_code(
@@ -29,13 +46,13 @@ def extract_code(
           If there is code block but the language is not specified, the language would be "".
     """
     if not detect_single_line_code:
-        match = re.findall(pattern, text, flags=re.DOTALL)
+        regex = CODE_BLOCK_REGEX if pattern == CODE_BLOCK_PATTERN else re.compile(pattern, flags=re.DOTALL)
+        match = regex.findall(text)
         return match if match else [("unknown", text)]
 
-    # Extract both multi-line and single-line code block, separated by the | operator
+    # Extract both multi-line and single-line code block
     # `([^`]+)`: Matches inline code.
-    code_pattern = re.compile(CODE_BLOCK_PATTERN + r"|`([^`]+)`")
-    code_blocks = code_pattern.findall(text)
+    code_blocks = CODE_OR_INLINE_REGEX.findall(text)
 
     # Extract the individual code blocks and languages from the matched groups
     extracted = []
@@ -52,6 +69,9 @@ def evaluate_python_code(code: str, authorized_imports: list[str]) -> str:
     Safely executes Python code in an isolated Jupyter notebook environment
     Returns the output as a string
     """
+    # Only the kernel executor needs these, and they are slow to import
+    import nbformat
+    from nbconvert.preprocessors import ExecutePreprocessor
     
     # Create new notebook with the code
     notebook = nbformat.v4.new_notebook()
@@ -83,4 +103,374 @@ def evaluate_python_code(code: str, authorized_imports: list[str]) -> str:
         return output.strip()
         
     finally:
-        os.unlink(tmp_name) 
\ No newline at end of file
+        os.unlink(tmp_name) 
+
+
+# Builtins exposed to tool call expressions evaluated in-process
+SAFE_BUILTINS = [
+    'abs', 'all', 'any', 'bool', 'dict', 'enumerate', 'float', 'frozenset', 'int',
+    'len', 'list', 'max', 'min', 'range', 'reversed', 'round', 'set', 'sorted',
+    'str', 'sum', 'tuple', 'zip',
+]
+
+
+def restricted_import(authorized_imports: list[str]):
+    """Builds an __import__ replacement that only admits modules from the allow-list"""
+    def _import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level != 0 or name.split('.')[0] not in authorized_imports:
+            raise ImportError(f"Import of '{name}' is not authorized")
+        return builtins.__import__(name, globals, locals, fromlist, level)
+    return _import
+
+
+def restricted_namespace(module, authorized_imports: list[str]) -> dict:
+    """Returns globals holding the public names of a compiled tool module and a reduced set of builtins"""
+    namespace = {name: value for name, value in vars(module).items() if not name.startswith('_')}
+    safe_builtins = {name: getattr(builtins, name) for name in SAFE_BUILTINS}
+    safe_builtins['__import__'] = restricted_import(authorized_imports)
+    namespace['__builtins__'] = safe_builtins
+    return namespace
+
+
+# Statements allowed before the tool call expression of a snippet
+SNIPPET_STATEMENTS = (ast.Assign, ast.AnnAssign, ast.AugAssign, ast.Expr, ast.Import, ast.ImportFrom, ast.Pass)
+
+
+def tool_module_classes(module) -> dict[str, type]:
+    """Public classes defined by a tool module: the argument models and the enums they use"""
+    return {
+        name: value for name, value in vars(module).items()
+        if not name.startswith('_') and inspect.isclass(value) and value.__module__ == module.__name__
+    }
+
+
+def tool_module_callables(module) -> set[str]:
+    """Names a snippet may call: the tool functions and model classes defined by a tool module"""
+    functions = {
+        name for name, value in vars(module).items()
+        if not name.startswith('_') and inspect.isfunction(value) and value.__module__ == module.__name__
+    }
+    return functions | set(tool_module_classes(module))
+
+
+def attribute_root(node: ast.Attribute) -> ast.expr:
+    while isinstance(node, ast.Attribute):
+        node = node.value
+    return node
+
+
+def model_instance_names(tree: ast.Module, classes: Container[str]) -> set[str]:
+    """Names a snippet only ever assigns model instances to, e.g. 'args' in 'args = GetWeatherModel(...)'"""
+    instance_targets = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Assign, ast.AnnAssign)) and isinstance(node.value, ast.Call) \
+                and isinstance(node.value.func, ast.Name) and node.value.func.id in classes:
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            instance_targets.update(id(target) for target in targets if isinstance(target, ast.Name))
+
+    instances, others = set(), set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            (instances if id(node) in instance_targets else others).add(node.id)
+        elif isinstance(node, ast.alias):
+            others.add((node.asname or node.name).split('.')[0])
+    return instances - others
+
+
+def check_snippet(tree: ast.Module, module):
+    """
+    Rejects snippets that do anything but build models and call tools: the only calls allowed
+    are to the tool functions and model classes of the module, by name, so there are no method
+    calls (e.g. str.format) to reach into objects with. Attributes may only be used on the
+    module's enums and on the model instances the snippet assigns, and the callable names
+    can't be rebound
+    """
+    classes = tool_module_classes(module)
+    callables = tool_module_callables(module)
+    enums = {name for name, value in classes.items() if issubclass(value, enum.Enum)}
+    instances = model_instance_names(tree, classes)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            if not (isinstance(node.func, ast.Name) and node.func.id in callables):
+                raise ValueError(f"Only tool functions and their models may be called, not '{ast.unparse(node.func)}'")
+        elif isinstance(node, ast.Attribute):
+            root = attribute_root(node)
+            allowed = (isinstance(root, ast.Name) and root.id in enums) or \
+                (isinstance(node.value, ast.Name) and node.value.id in instances)
+            if node.attr.startswith('_') or not allowed:
+                raise ValueError(f"Access to attribute '{ast.unparse(node)}' is not allowed")
+        elif isinstance(node, ast.Name):
+            if node.id.startswith('_'):
+                raise ValueError(f"Access to private name '{node.id}' is not allowed")
+            if not isinstance(node.ctx, ast.Load) and node.id in callables:
+                raise ValueError(f"'{node.id}' can't be reassigned")
+        elif isinstance(node, ast.alias):
+            if (node.asname or node.name).split('.')[0] in callables:
+                raise ValueError(f"'{node.asname or node.name}' can't be reassigned")
+
+
+def check_final_call(tree: ast.Module, tool_name: str):
+    """
+    Rejects snippets whose last statement, the one evaluated, isn't a call to tool_name,
+    so a block calling two tools can't resolve to one tool with the other's arguments
+    """
+    last = tree.body[-1] if tree.body else None
+    call = last.value if isinstance(last, ast.Expr) else None
+    if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Name) and call.func.id == tool_name):
+        raise SyntaxError(f"Snippet must end with the call to '{tool_name}'")
+
+
+def evaluate_expression(snippet: str, tool_name: str, module, authorized_imports: list[str]) -> str:
+    """
+    Evaluates a tool call snippet against a tool module and returns the arguments as JSON
+    The snippet is the call to tool_name, optionally preceded by simple statements such as
+    an assignment of the model instance, run in the same restricted namespace
+    """
+    tree = ast.parse(snippet.strip())
+    check_final_call(tree, tool_name)
+    *statements, call = tree.body
+    for statement in statements:
+        if not isinstance(statement, SNIPPET_STATEMENTS):
+            raise SyntaxError(f"'{type(statement).__name__}' statements are not allowed in tool call snippets")
+    check_snippet(tree, module)
+
+    namespace = restricted_namespace(module, authorized_imports)
+    if statements:
+        exec(compile(ast.Module(body=statements, type_ignores=[]), '<tool_call>', 'exec'), namespace)
+    result = eval(compile(ast.Expression(body=call.value), '<tool_call>', 'eval'), namespace)
+    return result.model_dump_json()
+
+
+class ExecutionBackend:
+    """Evaluates a validated tool call snippet against the code generated for its tool set"""
+    name = None
+
+    def run(self, snippet: str, tool_name: str, compiled: CompiledTools, authorized_imports: list[str]) -> str:
+        """Returns the arguments of the snippet's call to tool_name serialized as JSON"""
+        raise NotImplementedError
+
+
+class InProcessBackend(ExecutionBackend):
+    """
+    Evaluates the snippet directly against the cached model module, with a namespace
+    limited to the tool definitions and the import allow-list. Nothing bounds its CPU
+    time or memory, so it is only meant for trusted models and benchmarks
+    """
+    name = "inprocess"
+
+    def run(self, snippet: str, tool_name: str, compiled: CompiledTools, authorized_imports: list[str]) -> str:
+        return evaluate_expression(snippet, tool_name, compiled.module, authorized_imports)
+
+
+class KernelBackend(ExecutionBackend):
+    """
+    Runs the snippet in a Jupyter kernel, taken from the kernel pool when one is
+    configured, otherwise in a fresh kernel started for the call (see evaluate_python_code)
+    """
+    name = "kernel"
+
+    def run(self, snippet: str, tool_name: str, compiled: CompiledTools, authorized_imports: list[str]) -> str:
+        # The kernel inherits the server's environment, so snippets get the same checks
+        tree = ast.parse(snippet.strip())
+        check_final_call(tree, tool_name)
+        check_snippet(tree, compiled.module)
+        if kernel_pool:
+            # The kernel echoes the repr of the returned JSON string
+            return ast.literal_eval(kernel_pool.run(snippet, compiled))
+
+        code_to_execute = (compiled.code + "\n\n" + snippet).strip() + '.model_dump_json()'
+        logger.debug(f"Code to execute:\n{code_to_execute}")
+
+        # The kernel echoes the repr of the returned JSON string
+        return ast.literal_eval(evaluate_python_code(code_to_execute, authorized_imports))
+
+
+class ProcessBackend(ExecutionBackend):
+    """
+    Evaluates the snippet in a pool of sandboxed worker processes with
+    CPU, memory and import restrictions (see utils.process_pool)
+    """
+    name = "process"
+
+    def run(self, snippet: str, tool_name: str, compiled: CompiledTools, authorized_imports: list[str]) -> str:
+        if process_pool is None:
+            # Concurrent tool calls would otherwise each start a pool and shut down the last one
+            with process_pool_lock:
+                if process_pool is None:
+                    configure_process_pool()
+        return process_pool.run(snippet, tool_name, compiled, authorized_imports)
+
+
+kernel_pool = None
+process_pool = None
+process_pool_lock = threading.Lock()
+
+
+def configure_process_pool(size: int = 4, max_tasks: int = 1000, timeout: float = 5.0,
+                           cpu_seconds: float | None = 2.0, memory_mb: float | None = 512):
+    """Starts the pool of sandboxed workers used by the process backend, replacing the current one"""
+    global process_pool
+    from utils.process_pool import ProcessPool
+
+    if process_pool:
+        process_pool.shutdown()
+    pool = ProcessPool(size=size, max_tasks=max_tasks, timeout=timeout, cpu_seconds=cpu_seconds, memory_mb=memory_mb)
+    pool.start()
+    process_pool = pool
+
+
+def configure_kernel_pool(size: int, max_executions: int = 100, max_memory_mb: float | None = None,
+                          warmup_code: str | None = None):
+    """Starts a pool of pre-warmed kernels used by the kernel backend, or disables it when size is 0"""
+    global kernel_pool
+    from utils.kernel_pool import DEFAULT_WARMUP_CODE, KernelPool
+
+    if kernel_pool:
+        kernel_pool.shutdown()
+        kernel_pool = None
+    if size > 0:
+        pool = KernelPool(
+            size=size,
+            max_executions=max_executions,
+            max_memory_mb=max_memory_mb,
+            warmup_code=DEFAULT_WARMUP_CODE if warmup_code is None else warmup_code
+        )
+        pool.start()
+        kernel_pool = pool
+
+
+EXECUTION_BACKENDS = {backend.name: backend for backend in (InProcessBackend, ProcessBackend, KernelBackend)}
+
+executor: ExecutionBackend = ProcessBackend()
+
+
+def configure_executor(name: str):
+    """Selects the backend used to evaluate tool calls"""
+    global executor
+    if name not in EXECUTION_BACKENDS:
+        raise ValueError(f"Unknown execution backend '{name}', expected one of {list(EXECUTION_BACKENDS)}")
+    executor = EXECUTION_BACKENDS[name]()
+    logger.info(f"Using '{name}' execution backend")
+
+
+def get_executor() -> ExecutionBackend:
+    return executor
+
+
+EXTRACTION_MODES = ['ast', 'execute']
+
+extraction_mode = 'ast'
+
+
+def configure_extraction(mode: str):
+    """Selects whether tool call arguments are first resolved statically ('ast') or always executed ('execute')"""
+    global extraction_mode
+    if mode not in EXTRACTION_MODES:
+        raise ValueError(f"Unknown extraction mode '{mode}', expected one of {EXTRACTION_MODES}")
+    extraction_mode = mode
+
+
+def evaluate_tool_call(snippet: str, tool_name: str, compiled: CompiledTools, authorized_imports: list[str]) -> str:
+    """
+    Returns the JSON arguments of a validated tool call. Literal calls are resolved
+    from the AST without running any code, other snippets go through the executor.
+    """
+    if extraction_mode == 'ast':
+        try:
+            return extract_literal_arguments(snippet, tool_name, compiled)
+        except NonLiteralCallError as e:
+            logger.debug(f"Falling back to '{executor.name}' execution: {e}")
+
+    return executor.run(snippet, tool_name, compiled, authorized_imports)
+
+
+tool_call_seconds = histogram('tool_call_evaluation_seconds', 'Time spent resolving the arguments of a single tool call')
+tool_calls_seconds = histogram('tool_calls_evaluation_seconds', 'Time spent resolving all tool calls of a completion')
+tool_call_failures = counter('tool_call_failures_total', 'Tool calls whose arguments could not be resolved')
+
+evaluation_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='tool-call')
+
+
+def configure_tool_call_workers(max_workers: int):
+    """Sets how many tool calls of a single completion are evaluated concurrently"""
+    global evaluation_pool
+    evaluation_pool.shutdown(wait=False)
+    evaluation_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tool-call')
+
+
+def _timed_evaluate_tool_call(snippet: str, tool_name: str, compiled: CompiledTools, authorized_imports: list[str]):
+    start = time.perf_counter()
+    try:
+        return evaluate_tool_call(snippet, tool_name, compiled, authorized_imports)
+    except Exception as e:
+        tool_call_failures.inc(tool=tool_name)
+        logger.error(f"Tool call evaluation error for '{tool_name}': {str(e)}")
+        return e
+    finally:
+        tool_call_seconds.observe(time.perf_counter() - start, mode=extraction_mode)
+
+
+def submit_tool_call(snippet: str, tool_name: str, compiled: CompiledTools, authorized_imports: list[str]) -> Future:
+    """
+    Starts evaluating a tool call on the evaluation pool
+    The future resolves to the JSON arguments of the call, or the exception it raised
+    """
+    return evaluation_pool.submit(_timed_evaluate_tool_call, snippet, tool_name, compiled, authorized_imports)
+
+
+def evaluate_tool_calls(calls: list[tuple[str, str]], compiled: CompiledTools, authorized_imports: list[str]) -> list[Union[str, Exception]]:
+    """
+    Evaluates (snippet, tool_name) pairs concurrently on the evaluation pool
+    Returns the JSON arguments of each call in input order, or the exception it raised
+    """
+    start = time.perf_counter()
+    if len(calls) > 1:
+        futures = [submit_tool_call(snippet, tool_name, compiled, authorized_imports) for snippet, tool_name in calls]
+        results = [future.result() for future in futures]
+    else:
+        results = [_timed_evaluate_tool_call(snippet, tool_name, compiled, authorized_imports) for snippet, tool_name in calls]
+
+    if calls:
+        tool_calls_seconds.observe(time.perf_counter() - start)
+    return results
+
+
+@dataclass
+class ToolCallRejection:
+    """A snippet that could not be turned into a tool call"""
+    reason: str  # unknown_tool, malformed, invalid_arguments or evaluation_error
+    name: Optional[str]  # The tool called, None for a code block calling none
+    snippet: str
+    error: Optional[str] = None
+
+    @classmethod
+    def from_error(cls, name: str, snippet: str, error: Exception) -> "ToolCallRejection":
+        if isinstance(error, SyntaxError):
+            reason = 'malformed'
+        elif isinstance(error, (ValidationError, SandboxValidationError)):
+            reason = 'invalid_arguments'
+        else:
+            reason = 'evaluation_error'
+        return cls(reason, name, snippet, str(error))
+
+    @classmethod
+    def unmatched(cls, match: ToolCallMatch, snippet: str, fenced: bool) -> Optional["ToolCallRejection"]:
+        """
+        The rejection of a snippet that doesn't call a tool: a call to an unknown name,
+        or a code block calling nothing. Replies without code blocks are plain answers
+        """
+        if match.unknown:
+            return cls('unknown_tool', match.called, snippet)
+        if fenced:
+            return cls('malformed', None, snippet, "Code block doesn't call a tool")
+        return None
+
+
+tool_call_rejections = counter('tool_call_rejections_total', 'Code blocks and snippets that were not turned into tool calls')
+
+
+def report_rejections(rejections: list[ToolCallRejection]):
+    """Counts rejected tool calls by reason and logs each one as a JSON record"""
+    for rejection in rejections:
+        tool_call_rejections.inc(reason=rejection.reason)
+        logger.warning(f"Rejected tool call: {json.dumps(asdict(rejection))}")
@@ -1,16 +1,85 @@
 import ast
-from typing import Any, List, OrderedDict
+import hashlib
+import re
+import sys
+import threading
+import types
+from dataclasses import dataclass
+from typing import Any, Container, List, Optional, OrderedDict
 from caseconverter import pascalcase
-import astor
 import json
-import isort
-from isort import Config
-from datamodel_code_generator import DataModelType, PythonVersion
-from datamodel_code_generator.model import get_data_model_types
-from datamodel_code_generator.parser.jsonschema import JsonSchemaParser
+from utils import disk_cache
+from utils.cache import LRUCache
+from utils.metrics import counter
+from utils.schema_compiler import UnsupportedSchema, compile_tool_set
+
+
+@dataclass
+class CompiledTools:
+    """Generated tool code along with the module it was executed into"""
+    fingerprint: str
+    code: str
+    module: types.ModuleType
+    tool_models: dict[str, str]  # Tool function name -> name of its arguments model
+
+
+def _drop_compiled_module(key, compiled: CompiledTools):
+    sys.modules.pop(compiled.module.__name__, None)
+
+
+# Cache of generated code keyed by (tools fingerprint, return_args)
+code_cache = LRUCache(max_size=256, on_evict=_drop_compiled_module)
+
+# Serializes code generation: datamodel-code-generator imports its formatters lazily and isn't
+# safe to run concurrently, and concurrent requests for a new tool set should only build it once
+codegen_lock = threading.Lock()
+
+
+tool_sets_compiled = counter('tool_sets_compiled_total', 'Tool sets compiled, by the compiler that handled them')
+
+# direct: build models straight from simple schemas, falling back to datamodel-code-generator
+# datamodel: always go through datamodel-code-generator
+CODEGEN_MODES = ['direct', 'datamodel']
+codegen_mode = 'direct'
+
+
+def configure_codegen(mode: str = 'direct'):
+    """Selects how tool schemas are compiled into models (see CODEGEN_MODES)"""
+    global codegen_mode
+    if mode not in CODEGEN_MODES:
+        raise ValueError(f"Unknown codegen mode '{mode}', expected one of {CODEGEN_MODES}")
+    codegen_mode = mode
+
+
+def configure_code_cache(max_size: int = 256, ttl: Optional[float] = None):
+    """Replaces the generated code cache with one using the provided limits"""
+    global code_cache
+    code_cache.clear()
+    code_cache = LRUCache(max_size=max_size, ttl=ttl, on_evict=_drop_compiled_module)
 
 
 def json_schema_to_code(json_schema: str):
+    """Generates Pydantic model source for a JSON schema, through the on-disk cache when enabled"""
+    cache = disk_cache.shared_cache
+    if cache is None:
+        return generate_schema_code(json_schema)
+
+    key = cache.key('schema', json_schema)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached[0]
+
+    code = generate_schema_code(json_schema)
+    cache.set(key, code)
+    return code
+
+
+def generate_schema_code(json_schema: str):
+    # Imported on first use: datamodel-code-generator dominates the startup time otherwise
+    from datamodel_code_generator import DataModelType, PythonVersion
+    from datamodel_code_generator.model import get_data_model_types
+    from datamodel_code_generator.parser.jsonschema import JsonSchemaParser
+
     data_model_types = get_data_model_types(
         DataModelType.PydanticV2BaseModel,
         target_python_version=PythonVersion.PY_311
@@ -62,7 +131,88 @@ def get_fn_call_example_str(function: dict):
 def get_fn_names(tools: list[dict]):
     return ", ".join([tool['function']['name'] for tool in tools])
 
+class FingerprintedTools(list):
+    """A tool list carrying its content hash, so it is only computed once per tool set"""
+
+    def __init__(self, tools: List[Any], fingerprint: str):
+        super().__init__(tools)
+        self.fingerprint = fingerprint
+
+
+def tools_fingerprint(tools: List[Any]) -> str:
+    """Returns a stable content hash of a tool list, independent of key order"""
+    if isinstance(tools, FingerprintedTools):
+        return tools.fingerprint
+    canonical = json.dumps(tools, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def compile_code_module(code: str, name: str, code_object: Optional[types.CodeType] = None) -> types.ModuleType:
+    """
+    Executes generated code (or its already compiled code object) into a fresh
+    module registered in sys.modules so Pydantic can resolve postponed annotations against it
+    """
+    module = types.ModuleType(name)
+    sys.modules[name] = module
+    try:
+        exec(code_object or compile(code, f'<{name}>', 'exec'), module.__dict__)
+    except Exception:
+        sys.modules.pop(name, None)
+        raise
+    return module
+
+def get_compiled_tools(tools: List[Any], return_args: bool = False) -> CompiledTools:
+    """
+    Returns the generated code and compiled model module for a tool list,
+    served from the content-addressed code cache when possible
+    """
+    fingerprint = tools_fingerprint(tools)
+    key = (fingerprint, return_args)
+
+    def build():
+        module_name = f"tool_models_{fingerprint[:16]}{'_args' if return_args else ''}"
+        tool_models = {tool['function']['name']: get_args_type(tool) for tool in tools}
+        if codegen_mode == 'direct':
+            try:
+                compiled = compile_tool_set(tools, tool_models, module_name, return_args)
+                sys.modules[module_name] = compiled.module
+                tool_sets_compiled.inc(compiler='direct')
+                return CompiledTools(fingerprint, compiled.code, compiled.module, tool_models)
+            except UnsupportedSchema:
+                pass
+
+        code, code_object = generate_cached_code(tools, return_args, fingerprint)
+        tool_sets_compiled.inc(compiler='datamodel')
+        return CompiledTools(fingerprint, code, compile_code_module(code, module_name, code_object), tool_models)
+
+    if key not in code_cache:
+        with codegen_lock:
+            return code_cache.get_or_set(key, build)
+    return code_cache.get_or_set(key, build)
+
+def generate_cached_code(tools: List[Any], return_args: bool = False, fingerprint: Optional[str] = None):
+    """
+    Returns the generated code for a tool list along with its compiled code object,
+    read from the on-disk cache when enabled (the code object may then be None)
+    """
+    cache = disk_cache.shared_cache
+    if cache is None:
+        return generate_code(tools, return_args), None
+
+    key = cache.key('tools', fingerprint or tools_fingerprint(tools), str(return_args))
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    code = generate_code(tools, return_args)
+    code_object = compile(code, '<tool_models>', 'exec')
+    cache.set(key, code, code_object)
+    return code, code_object
+
 def get_code(tools: List[Any], return_args: bool = False):
+    """Returns the generated Python code for a tool list (see generate_code)"""
+    return get_compiled_tools(tools, return_args).code
+
+def generate_code(tools: List[Any], return_args: bool = False):
     """
     Generates complete Python code including:
     - Pydantic models for parameter validation
@@ -78,7 +228,8 @@ def get_code(tools: List[Any], return_args: bool = False):
         fns.append(fn_def)
         codes.append(fn_def)
 
-    return isort.code(remove_duplicate_imports("\n\n".join(codes)), config=Config(profile="black"))
+    import isort
+    return isort.code(remove_duplicate_imports("\n\n".join(codes)), config=isort.Config(profile="black"))
 
 def remove_duplicate_imports(source):
     """
@@ -136,18 +287,49 @@ def remove_duplicate_imports(source):
     new_tree = ast.Module(body=new_body, type_ignores=[])
 
     # Convert back to source code
+    import astor
     new_source = astor.to_source(new_tree)
 
     return new_source
 
-def is_valid_tool_call(code: str, tools: List[Any]):
+# Name called at the very start of a snippet, e.g. "get_weather" in "get_weather(GetWeatherArgs(...))",
+# the best guess for snippets that don't parse
+CALL_PATTERN = re.compile(r"([A-Za-z_][\w.]*)\(")
+
+
+@dataclass
+class ToolCallMatch:
+    """What a snippet calls: a known tool, an unknown name, or nothing at all"""
+    name: Optional[str]  # The tool called, None when the snippet doesn't call a known tool
+    called: Optional[str] = None  # The name the snippet calls, known or not
+
+    @property
+    def unknown(self) -> bool:
+        return self.name is None and self.called is not None
+
+
+def match_tool_call(code: str, tool_names: Container[str]) -> ToolCallMatch:
     """
-    Validates if a code snippet is calling one of the defined tools
-    Returns the function name if valid, None otherwise
+    Looks up the name called by the last statement of a snippet, the call that is evaluated,
+    in an index of tool names (e.g. CompiledTools.tool_models), so the cost doesn't grow
+    with the number of tools
     """
-    fn_names = [tool['function']['name'] for tool in tools]
+    try:
+        called = last_statement_call(ast.parse(code.strip()))
+    except SyntaxError:
+        match = CALL_PATTERN.match(code)
+        called = match.group(1) if match else None
+    if called is None:
+        return ToolCallMatch(None)
+    return ToolCallMatch(called if called in tool_names else None, called)
+
 
-    for fn_name in fn_names:
-        if code.startswith(fn_name+'('):
-            return fn_name
-    return None 
\ No newline at end of file
+def last_statement_call(tree: ast.Module) -> Optional[str]:
+    """
+    Name called by the last statement of a snippet, e.g. "get_weather" in
+    "args = GetWeatherArgs(...)" followed by "get_weather(args)"
+    """
+    last = tree.body[-1] if tree.body else None
+    if isinstance(last, ast.Expr) and isinstance(last.value, ast.Call) and isinstance(last.value.func, (ast.Name, ast.Attribute)):
+        return ast.unparse(last.value.func)
+    return None
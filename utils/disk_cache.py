@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of generated tool code, shared by every worker using the same directory.
+
+Entries hold the generated source and, optionally, the marshalled bytecode of the
+compiled module. Keys combine the schema hash with the generator version, so an
+upgrade of datamodel-code-generator or of the code generation itself never serves
+stale code. Writes go through a temporary file and an atomic rename, and the
+directory is kept under a size cap by evicting the least recently used entries.
+
+Pre-warm a cache directory from tool definitions with:
+
+    python -m utils.disk_cache --dir /var/cache/tool-code tools.jsonl
+"""
+import argparse
+import hashlib
+import importlib.util
+import json
+import logging
+import marshal
+import os
+import sys
+import tempfile
+import threading
+from importlib.metadata import PackageNotFoundError, version
+from types import CodeType
+from typing import Optional
+
+logger = logging.getLogger('tool_call_code_execution')
+
+# Bump when the code generated for a given schema changes
+CODEGEN_VERSION = 1
+
+
+def generator_version() -> str:
+    """Identifies everything the generated code depends on besides the schema itself"""
+    versions = [f"codegen{CODEGEN_VERSION}", f"py{sys.version_info.major}.{sys.version_info.minor}"]
+    for package in ('datamodel-code-generator', 'isort', 'astor'):
+        try:
+            versions.append(f"{package}{version(package)}")
+        except PackageNotFoundError:
+            versions.append(f"{package}?")
+    return "-".join(versions)
+
+
+class DiskCache:
+    """Directory of generated sources and bytecode, safe for concurrent processes"""
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, store_bytecode: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.store_bytecode = store_bytecode
+        self.version = generator_version()
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, *parts: str) -> str:
+        return hashlib.sha256("\0".join((self.version,) + parts).encode('utf-8')).hexdigest()
+
+    def _file(self, key: str, suffix: str) -> str:
+        return os.path.join(self.path, key[:2], key + suffix)
+
+    def get(self, key: str) -> Optional[tuple[str, Optional[CodeType]]]:
+        """Returns the cached (source, code object) for key, the code object being None when unavailable"""
+        source_file = self._file(key, '.py')
+        try:
+            with open(source_file, encoding='utf-8') as f:
+                source = f.read()
+        except FileNotFoundError:
+            return None
+
+        # Refresh the access time used for LRU eviction
+        try:
+            os.utime(source_file)
+        except OSError:
+            pass
+
+        code = None
+        if self.store_bytecode:
+            try:
+                with open(self._file(key, '.pyc'), 'rb') as f:
+                    data = f.read()
+                magic = importlib.util.MAGIC_NUMBER
+                if data.startswith(magic):
+                    code = marshal.loads(data[len(magic):])
+            except (FileNotFoundError, ValueError, EOFError, TypeError):
+                code = None
+        return source, code
+
+    def set(self, key: str, source: str, code: Optional[CodeType] = None):
+        os.makedirs(os.path.dirname(self._file(key, '.py')), exist_ok=True)
+        if self.store_bytecode and code is not None:
+            # Bytecode first: a reader seeing the source may then use the bytecode too
+            self._atomic_write(self._file(key, '.pyc'), importlib.util.MAGIC_NUMBER + marshal.dumps(code))
+        self._atomic_write(self._file(key, '.py'), source.encode('utf-8'))
+
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % 32 == 1
+        if evict:
+            self.evict()
+
+    def _atomic_write(self, target: str, data: bytes):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, target)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        """Returns (last access, total size, key) for every entry"""
+        entries = []
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if not name.endswith('.py'):
+                    continue
+                key = name[:-3]
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                    size = stat.st_size
+                    try:
+                        size += os.stat(os.path.join(root, key + '.pyc')).st_size
+                    except FileNotFoundError:
+                        pass
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, size, key))
+        return entries
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits in max_bytes"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            for suffix in ('.py', '.pyc'):
+                try:
+                    os.unlink(self._file(key, suffix))
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+
+shared_cache: Optional[DiskCache] = None
+
+
+def configure_disk_cache(path: Optional[str], max_bytes: int = 256 * 1024 * 1024, store_bytecode: bool = True):
+    """Enables the on-disk code cache at path, or disables it when path is falsy"""
+    global shared_cache
+    shared_cache = DiskCache(path, max_bytes, store_bytecode) if path else None
+    if shared_cache:
+        logger.info(f"Using on-disk code cache at {path} ({shared_cache.version})")
+
+
+def load_tool_sets(path: str) -> list[list[dict]]:
+    """
+    Reads tool sets from a .json file holding a tool list, a list of tool lists or a request
+    body with "tools", or from a .jsonl file where each line is a tool list or a request body
+    """
+    with open(path) as f:
+        if path.endswith('.jsonl'):
+            items = [json.loads(line) for line in f if line.strip()]
+        else:
+            data = json.load(f)
+            items = data if isinstance(data, list) and data and isinstance(data[0], list) else [data]
+
+    tool_sets = []
+    for item in items:
+        tools = item.get('tools') if isinstance(item, dict) else item
+        if tools:
+            tool_sets.append(tools)
+    return tool_sets
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-warm the on-disk tool code cache')
+    parser.add_argument('files', nargs='+', help='.json or .jsonl files of tool definitions (request logs work too)')
+    parser.add_argument('--dir', required=True, help='Cache directory')
+    parser.add_argument('--max-bytes', type=int, default=256 * 1024 * 1024, help='Cache size cap')
+    parser.add_argument('--no-bytecode', action='store_true', help='Only store generated sources')
+    args = parser.parse_args()
+
+    # Configure the module code_generation reads, not this __main__ copy of it
+    from utils import disk_cache
+    from utils.code_generation import generate_cached_code
+
+    disk_cache.configure_disk_cache(args.dir, args.max_bytes, not args.no_bytecode)
+    seen = set()
+    for path in args.files:
+        for tools in load_tool_sets(path):
+            canonical = json.dumps(tools, sort_keys=True)
+            if canonical in seen:
+                continue
+            seen.add(canonical)
+            for return_args in (False, True):
+                generate_cached_code(tools, return_args)
+    print(f"Warmed {len(seen)} tool sets into {args.dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from typing import Optional
+from jupyter_client import KernelManager
+from utils.code_generation import CompiledTools
+from utils.metrics import counter
+
+logger = logging.getLogger('tool_call_code_execution')
+
+kernel_restarts = counter('kernel_restarts_total', 'Pooled kernels replaced, by reason')
+
+DEFAULT_WARMUP_CODE = "import json, sys, types\nimport pydantic"
+
+
+def process_rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of a process in MB, or None where /proc is unavailable"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class PooledKernel:
+    """A started kernel with its blocking client and bookkeeping"""
+
+    def __init__(self, kernel_name: str, warmup_code: str, timeout: float):
+        self.manager = KernelManager(kernel_name=kernel_name)
+        self.manager.start_kernel()
+        self.client = self.manager.blocking_client()
+        self.client.start_channels()
+        self.client.wait_for_ready(timeout=60)
+        self.executions = 0
+        self.loaded_modules = set()
+        if warmup_code:
+            self.execute(warmup_code, timeout)
+
+    @property
+    def pid(self) -> Optional[int]:
+        provisioner = getattr(self.manager, 'provisioner', None)
+        return getattr(provisioner, 'pid', None)
+
+    def execute(self, code: str, timeout: float) -> str:
+        """Runs code in the kernel and returns its stream and result output"""
+        output = []
+        error = []
+
+        def on_output(msg):
+            msg_type = msg['header']['msg_type']
+            content = msg['content']
+            if msg_type == 'stream':
+                output.append(content['text'])
+            elif msg_type == 'execute_result':
+                output.append(str(content['data'].get('text/plain', '')))
+            elif msg_type == 'error':
+                error.append(f"{content['ename']}: {content['evalue']}")
+
+        self.client.execute_interactive(code, timeout=timeout, output_hook=on_output, store_history=False)
+        if error:
+            raise RuntimeError(error[0])
+        return "".join(output).strip()
+
+    def load_module(self, compiled: CompiledTools, module_name: str, timeout: float):
+        """Defines the generated models of a tool set as an importable module, once per kernel"""
+        if module_name in self.loaded_modules:
+            return
+        self.execute(
+            f"_m = types.ModuleType({module_name!r})\n"
+            f"sys.modules[{module_name!r}] = _m\n"
+            f"exec(compile({compiled.code!r}, {module_name!r}, 'exec'), _m.__dict__)\n"
+            f"del _m",
+            timeout
+        )
+        self.loaded_modules.add(module_name)
+
+    def shutdown(self):
+        try:
+            self.client.stop_channels()
+            self.manager.shutdown_kernel(now=True)
+        except Exception as e:
+            logger.warning(f"Error shutting down kernel: {str(e)}")
+
+
+class KernelPool:
+    """
+    Pool of pre-started Jupyter kernels with pydantic and the generated model
+    modules already imported. Kernels are checked out for a single execution and
+    replaced after max_executions runs, when their memory grows past
+    max_memory_mb, or when an execution times out.
+    """
+
+    def __init__(self, size: int = 4, max_executions: int = 100, max_memory_mb: Optional[float] = None,
+                 timeout: float = 30, warmup_code: str = DEFAULT_WARMUP_CODE, kernel_name: str = 'python3'):
+        self.size = size
+        self.max_executions = max_executions
+        self.max_memory_mb = max_memory_mb
+        self.timeout = timeout
+        self.warmup_code = warmup_code
+        self.kernel_name = kernel_name
+        self._idle: queue.Queue = queue.Queue()
+        self._closed = False
+        # Recently used tool sets, preloaded into every kernel started later on
+        self._tool_sets: OrderedDict = OrderedDict()
+        self._max_preloaded = 32
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts all kernels in parallel and waits until they are ready"""
+        threads = [threading.Thread(target=self._add_kernel) for _ in range(self.size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        logger.info(f"Started kernel pool with {self._idle.qsize()} kernels")
+
+    def _add_kernel(self):
+        try:
+            kernel = PooledKernel(self.kernel_name, self.warmup_code, self.timeout)
+            with self._lock:
+                tool_sets = list(self._tool_sets.items())
+            for module_name, compiled in tool_sets:
+                kernel.load_module(compiled, module_name, self.timeout)
+        except Exception as e:
+            logger.error(f"Failed to start pooled kernel: {str(e)}")
+            return
+        if self._closed:
+            kernel.shutdown()
+        else:
+            self._idle.put(kernel)
+
+    def _replace(self, kernel: PooledKernel, reason: str):
+        """Shuts a kernel down and starts its replacement off the request path"""
+        kernel_restarts.inc(reason=reason)
+        logger.info(f"Replacing pooled kernel after {kernel.executions} executions ({reason})")
+        kernel.shutdown()
+        threading.Thread(target=self._add_kernel, daemon=True).start()
+
+    def checkout(self) -> PooledKernel:
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No kernel available after {self.timeout}s")
+
+    def release(self, kernel: PooledKernel):
+        """Returns a kernel to the pool, or recycles it if it is past its limits"""
+        rss = process_rss_mb(kernel.pid) if self.max_memory_mb and kernel.pid else None
+        if kernel.executions >= self.max_executions:
+            self._replace(kernel, 'executions')
+        elif rss is not None and rss > self.max_memory_mb:
+            self._replace(kernel, 'memory')
+        else:
+            self._idle.put(kernel)
+
+    def run(self, snippet: str, compiled: CompiledTools) -> str:
+        """Evaluates a tool call snippet against its tool set's models and returns the kernel output"""
+        module_name = f"tool_models_{compiled.fingerprint[:16]}"
+        with self._lock:
+            self._tool_sets[module_name] = compiled
+            self._tool_sets.move_to_end(module_name)
+            while len(self._tool_sets) > self._max_preloaded:
+                self._tool_sets.popitem(last=False)
+
+        kernel = self.checkout()
+        try:
+            kernel.load_module(compiled, module_name, self.timeout)
+            kernel.executions += 1
+            output = kernel.execute(f"from {module_name} import *\n{snippet.strip()}.model_dump_json()", self.timeout)
+        except TimeoutError:
+            self._replace(kernel, 'timeout')
+            raise TimeoutError(f"Tool call execution timed out after {self.timeout}s")
+        except Exception:
+            self.release(kernel)
+            raise
+        self.release(kernel)
+        return output
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().shutdown()
+            except queue.Empty:
+                break
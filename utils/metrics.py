@@ -0,0 +1,172 @@
+import bisect
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+# Latency buckets in seconds, from sub-millisecond tool call evaluation to multi-minute completions
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def label_key(labels: dict) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Counter:
+    """Monotonically increasing value, optionally split by labels"""
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self.values.get(label_key(labels), 0)
+
+
+class Histogram:
+    """Distribution of observed values over fixed buckets, optionally split by labels"""
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [bucket counts..., sum, count]
+        self.values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        series = self.values.get(label_key(labels))
+        return series[-1] if series else 0
+
+    def sum(self, **labels) -> float:
+        series = self.values.get(label_key(labels))
+        return series[-2] if series else 0.0
+
+
+class Gauge:
+    """Value read from a callback when metrics are collected, optionally split by labels"""
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, callback: Callable[[], object]):
+        self.name = name
+        self.description = description
+        self.callback = callback
+
+    @property
+    def values(self) -> Dict[tuple, float]:
+        value = self.callback()
+        return value if isinstance(value, dict) else {(): value}
+
+
+# All metrics of the process, by name
+REGISTRY: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(cls, name: str, description: str, **kwargs):
+    with _registry_lock:
+        metric = REGISTRY.get(name)
+        if metric is None:
+            metric = REGISTRY[name] = cls(name, description, **kwargs)
+        return metric
+
+
+def counter(name: str, description: str) -> Counter:
+    return _get_or_create(Counter, name, description)
+
+
+def histogram(name: str, description: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, description, buckets=buckets)
+
+
+def gauge(name: str, description: str, callback: Callable[[], object]) -> Gauge:
+    """
+    Registers a gauge read from callback at collection time. The callback returns
+    a number, or a dict mapping label keys (see label_key) to numbers
+    """
+    return _get_or_create(Gauge, name, description, callback=callback)
+
+
+def _format_labels(key: tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (k + '="' + v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus() -> str:
+    """Renders every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in list(REGISTRY.values()):
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        values = dict(metric.values)
+        if metric.kind != "histogram":
+            for key, value in values.items():
+                lines.append(f"{metric.name}{_format_labels(key)} {value}")
+            continue
+        for key, series in values.items():
+            cumulative = 0
+            for bound, count in zip(metric.buckets, series):
+                cumulative += count
+                lines.append(f"{metric.name}_bucket{_format_labels(key, ('le', repr(float(bound))))} {cumulative}")
+            lines.append(f"{metric.name}_bucket{_format_labels(key, ('le', '+Inf'))} {series[-1]}")
+            lines.append(f"{metric.name}_sum{_format_labels(key)} {series[-2]}")
+            lines.append(f"{metric.name}_count{_format_labels(key)} {series[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+stage_seconds = histogram('chat_stage_seconds', 'Time spent in each stage of a chat completion request')
+
+# Per-request trace, collected when tracing is enabled for the current request
+current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar('current_trace', default=None)
+
+
+class Trace:
+    """Stage durations of a single request, identified by a trace ID"""
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.stages: Dict[str, float] = {}
+
+    def server_timing(self) -> str:
+        """Stage durations formatted for the Server-Timing response header"""
+        return ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in self.stages.items())
+
+
+@contextmanager
+def span(stage: str):
+    """Times a block of work into the chat_stage_seconds histogram and the current trace"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.stages[stage] = trace.stages.get(stage, 0.0) + elapsed
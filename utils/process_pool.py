@@ -0,0 +1,251 @@
+import importlib.abc
+import logging
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict
+from typing import Optional
+from utils.code_generation import CompiledTools
+from utils.metrics import counter
+
+logger = logging.getLogger('tool_call_code_execution')
+
+worker_restarts = counter('sandbox_worker_restarts_total', 'Sandboxed worker processes replaced, by reason')
+
+# Imported lazily by pydantic while validating, admitted by the import guard whatever the allow-list
+RUNTIME_MODULES = ('pydantic', 'pydantic_core', 'typing_extensions', 'annotated_types', 'encodings')
+
+
+class SandboxValidationError(ValueError):
+    """A pydantic ValidationError raised in a worker, reported as invalid arguments"""
+
+
+class ImportGuard(importlib.abc.MetaPathFinder):
+    """Refuses to import modules outside of the allow-list, however the import is reached"""
+
+    def __init__(self):
+        self.allowed = set(RUNTIME_MODULES)
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname.split('.')[0] not in self.allowed:
+            raise ImportError(f"Import of '{fullname}' is not authorized")
+        return None
+
+
+def apply_limits(memory_mb: Optional[float]):
+    import resource
+    if memory_mb:
+        limit = int(memory_mb * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    # Tool calls have no business writing files
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+
+
+def set_cpu_budget(cpu_seconds: Optional[float]):
+    """Lets the next task use cpu_seconds on top of the CPU time already used, SIGXCPU kills the worker past it"""
+    import resource
+    if cpu_seconds:
+        used = resource.getrusage(resource.RUSAGE_SELF)
+        budget = int(used.ru_utime + used.ru_stime + cpu_seconds) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (budget, resource.RLIM_INFINITY))
+
+
+def worker_main(conn, memory_mb: Optional[float], cpu_seconds: Optional[float]):
+    """
+    Serves ('load', module_name, code) and ('run', module_name, snippet, tool_name, authorized_imports)
+    messages until the pipe closes, answering ('ok', result) or ('error', kind, message)
+    """
+    from pydantic import ValidationError
+    from utils.code_execution import evaluate_expression
+
+    guard = ImportGuard()
+    apply_limits(memory_mb)
+    sys.meta_path.insert(0, guard)
+    modules = {}
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            if message[0] == 'load':
+                _, module_name, code = message
+                module = types.ModuleType(module_name)
+                sys.modules[module_name] = module
+                exec(compile(code, module_name, 'exec'), module.__dict__)
+                modules[module_name] = module
+                reply = ('ok', None)
+            else:
+                _, module_name, snippet, tool_name, authorized_imports = message
+                guard.allowed = set(RUNTIME_MODULES) | set(authorized_imports)
+                set_cpu_budget(cpu_seconds)
+                reply = ('ok', evaluate_expression(snippet, tool_name, modules[module_name], authorized_imports))
+        except ValidationError as e:
+            reply = ('error', 'ValidationError', str(e))
+        except SyntaxError as e:
+            reply = ('error', 'SyntaxError', str(e))
+        except BaseException as e:
+            reply = ('error', type(e).__name__, str(e))
+        conn.send(reply)
+
+
+class SandboxWorker:
+    """A worker process started from the fork server, with its end of the pipe"""
+
+    def __init__(self, context, memory_mb: Optional[float], cpu_seconds: Optional[float]):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn, memory_mb, cpu_seconds), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+        self.loaded_modules = set()
+        self.broken = False
+
+    def request(self, message: tuple, timeout: float):
+        """Sends a message and waits for the reply, raising the error the worker reported"""
+        self.conn.send(message)
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"Tool call execution timed out after {timeout}s")
+        try:
+            reply = self.conn.recv()
+        except EOFError:
+            # Killed by one of its resource limits
+            self.broken = True
+            raise RuntimeError(f"Sandboxed worker died (exit code {self.process.exitcode})") from None
+        if reply[0] == 'ok':
+            return reply[1]
+        _, kind, error = reply
+        if kind == 'SyntaxError':
+            raise SyntaxError(error)
+        if kind == 'ValidationError':
+            raise SandboxValidationError(error)
+        if kind == 'MemoryError':
+            raise MemoryError(error)
+        raise RuntimeError(f"{kind}: {error}")
+
+    def load_module(self, compiled: CompiledTools, module_name: str, timeout: float):
+        """Defines the generated models of a tool set in the worker, once per worker"""
+        if module_name in self.loaded_modules:
+            return
+        self.request(('load', module_name, compiled.code), timeout)
+        self.loaded_modules.add(module_name)
+
+    @property
+    def alive(self) -> bool:
+        return not self.broken and self.process.is_alive()
+
+    def shutdown(self):
+        self.conn.close()
+        self.process.kill()
+        self.process.join(timeout=1)
+
+
+class ProcessPool:
+    """
+    Pool of long-lived sandboxed worker processes evaluating tool call snippets.
+    Workers are forked from a fork server with pydantic already imported, run under
+    CPU time and address space limits with an import guard enforcing the allow-list,
+    and talk to the proxy over pipes. They are checked out for a single call and
+    replaced after max_tasks calls, or when a call times out or kills them.
+    """
+
+    def __init__(self, size: int = 4, max_tasks: int = 1000, timeout: float = 5.0,
+                 cpu_seconds: Optional[float] = 2.0, memory_mb: Optional[float] = 512):
+        self.size = size
+        self.max_tasks = max_tasks
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        if 'forkserver' in methods:
+            # Workers fork from a server that already imported these, instead of importing them on start
+            self._context.set_forkserver_preload(['pydantic', 'utils.code_execution', 'utils.process_pool'])
+        self._idle: queue.Queue = queue.Queue()
+        self._closed = False
+        # Recently used tool sets, preloaded into every worker started later on
+        self._tool_sets: OrderedDict = OrderedDict()
+        self._max_preloaded = 32
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts all workers and waits until they are ready"""
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._add_worker) for _ in range(self.size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        logger.info(f"Started {self._idle.qsize()} sandboxed workers in {time.perf_counter() - start:.2f}s")
+
+    def _add_worker(self):
+        try:
+            worker = SandboxWorker(self._context, self.memory_mb, self.cpu_seconds)
+            with self._lock:
+                tool_sets = list(self._tool_sets.items())
+            for module_name, compiled in tool_sets:
+                worker.load_module(compiled, module_name, self.timeout)
+        except Exception as e:
+            logger.error(f"Failed to start sandboxed worker: {str(e)}")
+            return
+        if self._closed:
+            worker.shutdown()
+        else:
+            self._idle.put(worker)
+
+    def _replace(self, worker: SandboxWorker, reason: str):
+        """Kills a worker and starts its replacement off the request path"""
+        worker_restarts.inc(reason=reason)
+        logger.info(f"Replacing sandboxed worker after {worker.tasks} tasks ({reason})")
+        worker.shutdown()
+        threading.Thread(target=self._add_worker, daemon=True).start()
+
+    def checkout(self) -> SandboxWorker:
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No sandboxed worker available after {self.timeout}s")
+
+    def release(self, worker: SandboxWorker):
+        """Returns a worker to the pool, or recycles it if it is past its limits or died"""
+        if not worker.alive:
+            self._replace(worker, 'died')
+        elif worker.tasks >= self.max_tasks:
+            self._replace(worker, 'tasks')
+        else:
+            self._idle.put(worker)
+
+    def run(self, snippet: str, tool_name: str, compiled: CompiledTools, authorized_imports: list[str]) -> str:
+        """Evaluates a snippet's call to tool_name against its tool set's models and returns the JSON arguments"""
+        module_name = f"tool_models_{compiled.fingerprint[:16]}"
+        with self._lock:
+            self._tool_sets[module_name] = compiled
+            self._tool_sets.move_to_end(module_name)
+            while len(self._tool_sets) > self._max_preloaded:
+                self._tool_sets.popitem(last=False)
+
+        worker = self.checkout()
+        try:
+            worker.load_module(compiled, module_name, self.timeout)
+            worker.tasks += 1
+            result = worker.request(('run', module_name, snippet, tool_name, list(authorized_imports)), self.timeout)
+        except TimeoutError:
+            self._replace(worker, 'timeout')
+            raise
+        except Exception:
+            self.release(worker)
+            raise
+        self.release(worker)
+        return result
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().shutdown()
+            except queue.Empty:
+                break
@@ -0,0 +1,178 @@
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+from typing import Optional
+from utils.metrics import counter
+
+logger = logging.getLogger('tool_call_code_execution')
+
+records_written = counter('request_log_written_total', 'Requests written to the request log')
+records_dropped = counter('request_log_dropped_total', 'Requests dropped because the request log queue was full')
+
+COMPRESSIONS = ['none', 'gzip', 'zstd']
+
+
+def serialize(record) -> str:
+    """Serializes a record to a single JSON line; raw JSON bodies are written as received when they fit on one line"""
+    if isinstance(record, bytes):
+        record = record.decode('utf-8', errors='replace')
+    if isinstance(record, str):
+        if '\n' not in record and '\r' not in record and record.startswith('{') and record.endswith('}'):
+            return record
+        try:
+            return json.dumps(json.loads(record))
+        except ValueError:
+            # Keep invalid bodies too, as a JSON string
+            return json.dumps(record)
+    return json.dumps(record)
+
+
+# Queued by close() to interrupt the writer's wait for records
+_WAKE_UP = object()
+
+
+class RequestLogger:
+    """
+    Appends request bodies to a JSONL file from a background thread.
+
+    Handlers only enqueue the record (a parsed body, or the raw JSON as received):
+    serialization and disk I/O happen on the
+    writer thread in batches, so lines never interleave and requests never wait
+    on the disk. When the queue is full records are dropped instead of blocking.
+    The active file is rotated by size and/or age, and rotated segments can be
+    compressed with gzip or zstd.
+    """
+
+    def __init__(self, path: str = 'requests.jsonl', max_queue: int = 10000, batch_size: int = 256,
+                 flush_interval: float = 1.0, max_bytes: Optional[int] = None, rotate_interval: Optional[float] = None,
+                 compression: str = 'none', sample_rate: float = 1.0):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}', expected one of {COMPRESSIONS}")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.compression = compression
+        self.sample_rate = sample_rate
+        self.written = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._opened_at = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-log', daemon=True)
+        self._thread.start()
+
+    def log(self, record) -> bool:
+        """Enqueues a record without blocking; returns False if it was sampled out or dropped"""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            records_dropped.inc()
+            return False
+
+    def stats(self) -> dict:
+        return {"written": self.written, "dropped": self.dropped, "queued": self._queue.qsize()}
+
+    def _run(self):
+        while not (self._stopped.is_set() and self._queue.empty()):
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            batch = [record for record in batch if record is not _WAKE_UP]
+
+            try:
+                self._maybe_rotate()
+                if batch:
+                    self._write(batch)
+            except Exception as e:
+                logger.error(f"Request log write error: {str(e)}")
+
+        if self._file:
+            self._file.close()
+
+    def _write(self, batch: list):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self._opened_at = time.monotonic()
+
+        self._file.write(''.join(serialize(record) + '\n' for record in batch))
+        self._file.flush()
+        self.written += len(batch)
+        records_written.inc(len(batch))
+
+    def _maybe_rotate(self):
+        if self._file is None:
+            return
+        too_big = self.max_bytes and self._file.tell() >= self.max_bytes
+        too_old = self.rotate_interval and time.monotonic() - self._opened_at >= self.rotate_interval
+        if too_big or too_old:
+            self.rotate()
+
+    def rotate(self):
+        """Closes the active file and moves it aside, compressed if configured"""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}.{time.time_ns() // 1_000_000}{ext}"
+        os.replace(self.path, rotated)
+
+        if self.compression == 'gzip':
+            with open(rotated, 'rb') as src, gzip.open(rotated + '.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.unlink(rotated)
+        elif self.compression == 'zstd':
+            import zstandard
+            with open(rotated, 'rb') as src, open(rotated + '.zst', 'wb') as dst:
+                zstandard.ZstdCompressor().copy_stream(src, dst)
+            os.unlink(rotated)
+
+    def close(self, timeout: float = 5.0):
+        """Flushes queued records and stops the writer thread"""
+        self._stopped.set()
+        # Wake the writer up rather than letting shutdown wait for its flush interval
+        try:
+            self._queue.put_nowait(_WAKE_UP)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+
+request_logger: Optional[RequestLogger] = None
+
+
+def configure_request_log(path: Optional[str] = 'requests.jsonl', **options):
+    """Replaces the request logger; a falsy path disables request logging"""
+    global request_logger
+    if request_logger:
+        request_logger.close()
+    request_logger = RequestLogger(path, **options) if path else None
+
+
+def log_request(record) -> bool:
+    return request_logger.log(record) if request_logger else False
+
+
+@atexit.register
+def _flush_on_exit():
+    if request_logger:
+        request_logger.close()
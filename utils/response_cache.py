@@ -0,0 +1,183 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from utils.cache import LRUCache
+
+logger = logging.getLogger('tool_call_code_execution')
+
+
+class MemoryBackend:
+    """Keeps serialized responses in an in-process LRU cache"""
+    name = "memory"
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.cache.get(key)
+
+    def set(self, key: str, value: str):
+        self.cache.set(key, value)
+
+    def clear(self):
+        self.cache.clear()
+
+    def size(self) -> int:
+        return len(self.cache)
+
+
+class SQLiteBackend:
+    """
+    Keeps serialized responses in a SQLite database, so they survive restarts
+    and are shared by workers on the same machine. Least recently read entries
+    are evicted once max_size is exceeded.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str, max_size: int = 100000, ttl: Optional[float] = None):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._writes = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl and row[1] + self.ttl <= now:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, value, now, now))
+            self._writes += 1
+            # Trimming scans the index, so only do it every few writes
+            if self._writes % 64 == 1:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        if self.ttl:
+            self._db.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,))
+        excess = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_size
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)", (excess,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+
+    def size(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+RESPONSE_CACHE_BACKENDS = ['memory', 'sqlite']
+
+
+class ResponseCache:
+    """
+    Caches final chat completion responses of deterministic requests, keyed by a
+    canonical hash of the model, the upstream messages, the tool set and the sampling parameters
+    """
+
+    def __init__(self, backend, force: bool = False):
+        self.backend = backend
+        self.force = force
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+
+    def is_cacheable(self, params: dict) -> bool:
+        """Whether a request with these upstream parameters gives reproducible responses"""
+        if params.get('stream'):
+            return False
+        return self.force or params.get('temperature') == 0
+
+    @staticmethod
+    def key(model: str, messages: list[dict], tools_fingerprint: Optional[str], params: dict) -> str:
+        # The tools are already hashed, and described in the system prompt
+        canonical = json.dumps(
+            {"model": model, "messages": messages, "tools": tools_fingerprint, "params": params},
+            sort_keys=True,
+            separators=(',', ':'),
+            ensure_ascii=False,
+            default=str
+        )
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, response: dict):
+        self.backend.set(key, json.dumps(response, separators=(',', ':')))
+
+    def bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "size": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+cache: Optional[ResponseCache] = None
+
+
+def configure_response_cache(
+    backend: Optional[str],
+    path: str = "response_cache.sqlite3",
+    max_size: int = 1024,
+    ttl: Optional[float] = None,
+    force: bool = False
+):
+    """Enables the response cache with the given backend ('memory' or 'sqlite'), or disables it when backend is falsy"""
+    global cache
+    if not backend:
+        cache = None
+        return
+    if backend == 'memory':
+        store = MemoryBackend(max_size, ttl)
+    elif backend == 'sqlite':
+        store = SQLiteBackend(path, max_size, ttl)
+    else:
+        raise ValueError(f"Unknown response cache backend '{backend}', expected one of {RESPONSE_CACHE_BACKENDS}")
+    cache = ResponseCache(store, force)
+    logger.info(f"Caching {'all' if force else 'deterministic'} responses in the {backend} backend")
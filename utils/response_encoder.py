@@ -0,0 +1,28 @@
+"""
+JSON encoding of response bodies.
+
+Uses orjson when it is installed (`pip install orjson`), which is several times
+faster than the standard library and produces UTF-8 bytes directly, and falls
+back to json otherwise. The bytes are the response body as is, with no string
+copy in between.
+"""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def encode_json(data: Any) -> bytes:
+    """Serializes data to compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def sse_data(payload: str | bytes) -> str:
+    """Formats an already serialized JSON payload as a server-sent event"""
+    if isinstance(payload, bytes):
+        payload = payload.decode('utf-8')
+    return f"data: {payload}\n\n"
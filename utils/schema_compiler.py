@@ -0,0 +1,315 @@
+"""
+Direct compilation of simple tool schemas into Pydantic models.
+
+Flat and lightly nested object schemas (scalars, enums, arrays, nested objects
+and string/number/array constraints) are read into a small tree of model specs,
+from which both the stub source shown to the model and the Pydantic models
+(built with pydantic.create_model) are produced, without generating, parsing
+and formatting source code. Schemas using anything else ($ref, oneOf, formats,
+...) raise UnsupportedSchema, and are left to datamodel-code-generator.
+"""
+import keyword
+import types
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Literal, Optional
+from caseconverter import pascalcase
+from pydantic import BaseModel, ConfigDict, Field, create_model
+
+HEADER = (
+    "from __future__ import annotations\n\n"
+    "from typing import Any, Dict, List, Literal, Optional\n\n"
+    "from pydantic import BaseModel, ConfigDict, Field\n"
+)
+
+# Names defined by HEADER, available to tool call snippets like in generated modules
+HEADER_NAMES = {
+    'Any': Any, 'Dict': Dict, 'List': List, 'Literal': Literal, 'Optional': Optional,
+    'BaseModel': BaseModel, 'ConfigDict': ConfigDict, 'Field': Field,
+}
+
+DEFERRED = ConfigDict(defer_build=True)
+
+SCALAR_TYPES = {'string': str, 'integer': int, 'number': float, 'boolean': bool}
+
+# JSON schema constraint -> Field argument
+CONSTRAINTS = {
+    'minLength': 'min_length', 'maxLength': 'max_length', 'pattern': 'pattern',
+    'minimum': 'ge', 'maximum': 'le', 'exclusiveMinimum': 'gt', 'exclusiveMaximum': 'lt',
+    'multipleOf': 'multiple_of', 'minItems': 'min_length', 'maxItems': 'max_length',
+}
+
+# JSON schema constraint -> annotations it applies to
+CONSTRAINT_TYPES = {
+    'minLength': ('str',), 'maxLength': ('str',), 'pattern': ('str',),
+    'minimum': ('int', 'float'), 'maximum': ('int', 'float'), 'exclusiveMinimum': ('int', 'float'),
+    'exclusiveMaximum': ('int', 'float'), 'multipleOf': ('int', 'float'),
+    'minItems': ('List',), 'maxItems': ('List',),
+}
+
+# Keywords without effect on validation
+ANNOTATIONS = {'title', 'description', 'default', 'examples', '$schema', '$comment'}
+
+OBJECT_KEYWORDS = ANNOTATIONS | {'type', 'properties', 'required', 'additionalProperties'}
+VALUE_KEYWORDS = ANNOTATIONS | {'type', 'enum', 'items'} | set(CONSTRAINTS)
+
+
+class UnsupportedSchema(Exception):
+    """Raised for schemas the direct compiler doesn't handle"""
+
+
+@dataclass
+class TypeRef:
+    """
+    A field annotation: 'str', 'int', 'float', 'bool', 'None', 'Any', a model name,
+    or 'List', 'Dict', 'Optional' or 'Literal' applied to args
+    """
+    name: str
+    args: tuple = ()
+
+    def source(self) -> str:
+        if self.name == 'Literal':
+            return f"Literal[{', '.join(repr(value) for value in self.args)}]"
+        if self.name == 'Dict':
+            return f"Dict[str, {self.args[0].source()}]"
+        if self.args:
+            return f"{self.name}[{self.args[0].source()}]"
+        return self.name
+
+    def resolve(self, models: dict[str, type]):
+        if self.name == 'Literal':
+            return Literal[self.args]
+        if self.name == 'List':
+            return List[self.args[0].resolve(models)]
+        if self.name == 'Dict':
+            return Dict[str, self.args[0].resolve(models)]
+        if self.name == 'Optional':
+            return Optional[self.args[0].resolve(models)]
+        if self.name in models:
+            return models[self.name]
+        return {'str': str, 'int': int, 'float': float, 'bool': bool, 'None': None, 'Any': Any}[self.name]
+
+
+@dataclass
+class FieldSpec:
+    name: str
+    type: TypeRef
+    required: bool
+    default: Any = None
+    options: dict = field(default_factory=dict)  # Field arguments: description, title and constraints
+
+    def source(self) -> str:
+        annotation = f"    {self.name}: {self.type.source()}"
+        if self.required and not self.options:
+            return annotation
+        default = '...' if self.required else repr(self.default)
+        if not self.options:
+            return f"{annotation} = {default}"
+        options = ''.join(f", {name}={value!r}" for name, value in self.options.items())
+        return f"{annotation} = Field({default}{options})"
+
+    def definition(self, models: dict[str, type]) -> tuple:
+        default = ... if self.required else self.default
+        return self.type.resolve(models), Field(default, **self.options) if self.options else default
+
+
+@dataclass
+class ModelSpec:
+    name: str
+    fields: list[FieldSpec]
+    forbid_extra: bool = False
+
+    def source(self) -> str:
+        lines = [f"class {self.name}(BaseModel):"]
+        if self.forbid_extra:
+            lines.append("    model_config = ConfigDict(\n        extra='forbid',\n    )")
+        lines.extend(spec.source() for spec in self.fields)
+        if len(lines) == 1:
+            lines.append("    pass")
+        return "\n".join(lines)
+
+    def build(self, models: dict[str, type], module_name: str) -> type:
+        # Validators are built on first use, most tools of a large set are never called
+        config = ConfigDict(defer_build=True, extra='forbid') if self.forbid_extra else DEFERRED
+        return create_model(
+            self.name,
+            __config__=config,
+            __module__=module_name,
+            **{spec.name: spec.definition(models) for spec in self.fields}
+        )
+
+
+def is_field_name(name: str) -> bool:
+    """Whether a property can be a model field as is, datamodel-code-generator aliases the others"""
+    return (name.isidentifier() and not keyword.iskeyword(name) and not name.startswith(('_', 'model_'))
+            and not hasattr(BaseModel, name))
+
+
+def check_constraint(constraint: str, value: Any, type_ref: TypeRef):
+    """
+    Raises UnsupportedSchema for constraints Pydantic can't apply to the field, which would
+    only fail when the deferred model is first built, i.e. on every call to the tool
+    """
+    if type_ref.name not in CONSTRAINT_TYPES[constraint]:
+        raise UnsupportedSchema(f"'{constraint}' doesn't apply to {type_ref.source()}")
+    if constraint == 'pattern':
+        valid = isinstance(value, str)
+    elif constraint in ('minLength', 'maxLength', 'minItems', 'maxItems'):
+        valid = type(value) is int and value >= 0
+    else:
+        valid = type(value) in (int, float)
+    if not valid:
+        raise UnsupportedSchema(f"Invalid value {value!r} for '{constraint}'")
+
+
+class SchemaCompiler:
+    """Reads the parameter schemas of a tool set into model specs, nested models first"""
+
+    def __init__(self, reserved: set[str] = frozenset()):
+        self.models: list[ModelSpec] = []
+        self.names = set(HEADER_NAMES)
+        self.reserved = set(reserved)  # Names of the tool models and functions, unavailable to nested models
+
+    def unique_name(self, name: str, exact: bool = False) -> str:
+        if not name.isidentifier() or keyword.iskeyword(name):
+            raise UnsupportedSchema(f"'{name}' is not a valid model name")
+        if exact:
+            if name in self.names:
+                raise UnsupportedSchema(f"Model name '{name}' is used twice")
+            self.names.add(name)
+            return name
+        unique, suffix = name, 1
+        while unique in self.names or unique in self.reserved:
+            unique, suffix = f"{name}{suffix}", suffix + 1
+        self.names.add(unique)
+        return unique
+
+    def add_model(self, name: str, schema: dict, exact: bool = False) -> str:
+        """Adds the model of an object schema, returning its name (made unique unless exact)"""
+        unsupported = set(schema) - OBJECT_KEYWORDS
+        if unsupported:
+            raise UnsupportedSchema(f"Unsupported keywords {sorted(unsupported)}")
+        extra = schema.get('additionalProperties', True)
+        if schema.get('type', 'object') != 'object' or not isinstance(extra, bool):
+            raise UnsupportedSchema("Not a plain object schema")
+
+        required = set(schema.get('required', ()))
+        fields = []
+        for prop, prop_schema in schema.get('properties', {}).items():
+            if not is_field_name(prop) or not isinstance(prop_schema, dict):
+                raise UnsupportedSchema(f"Property '{prop}' needs an alias")
+            fields.append(self.field(prop, prop_schema, prop in required))
+
+        name = self.unique_name(name, exact)
+        self.models.append(ModelSpec(name, fields, forbid_extra=not extra))
+        return name
+
+    def field(self, name: str, schema: dict, required: bool) -> FieldSpec:
+        type_ref, nullable = self.type_of(name, schema)
+        options = {}
+        if 'description' in schema:
+            options['description'] = schema['description']
+        if 'title' in schema:
+            options['title'] = schema['title']
+        for constraint, argument in CONSTRAINTS.items():
+            if constraint in schema:
+                check_constraint(constraint, schema[constraint], type_ref)
+                options[argument] = schema[constraint]
+
+        # Like datamodel-code-generator: optional and nullable fields are Optional
+        if (nullable or not required) and type_ref.name not in ('Optional', 'Any'):
+            type_ref = TypeRef('Optional', (type_ref,))
+        return FieldSpec(name, type_ref, required, schema.get('default'), options)
+
+    @staticmethod
+    def is_object(schema: dict) -> bool:
+        return schema.get('type') == 'object' and 'properties' in schema
+
+    def type_of(self, name: str, schema: dict) -> tuple[TypeRef, bool]:
+        """Returns the annotation of a property schema and whether it accepts null"""
+        if self.is_object(schema):
+            return TypeRef(self.add_model(pascalcase(name), schema)), False
+
+        unsupported = set(schema) - VALUE_KEYWORDS - {'additionalProperties'}
+        if unsupported:
+            raise UnsupportedSchema(f"Unsupported keywords {sorted(unsupported)}")
+
+        if 'enum' in schema:
+            values = tuple(schema['enum'])
+            if not values or not all(value is None or type(value) in (str, int, bool) for value in values):
+                raise UnsupportedSchema("Only enums of strings, integers and booleans are supported")
+            literals = tuple(value for value in values if value is not None)
+            return TypeRef('Literal', literals), len(literals) < len(values)
+
+        types_ = schema.get('type')
+        types_ = list(types_) if isinstance(types_, list) else [types_] if types_ else []
+        nullable = 'null' in types_
+        types_ = [t for t in types_ if t != 'null']
+        if not types_:
+            return TypeRef('Any'), nullable
+        if len(types_) > 1:
+            raise UnsupportedSchema("Unions of types are not supported")
+
+        type_ = types_[0]
+        if type_ in SCALAR_TYPES:
+            return TypeRef(SCALAR_TYPES[type_].__name__), nullable
+        if type_ == 'array':
+            items = schema.get('items', {})
+            if not isinstance(items, dict):
+                raise UnsupportedSchema("Tuple arrays are not supported")
+            if self.is_object(items):
+                return TypeRef('List', (TypeRef(self.add_model(pascalcase(name) + 'Item', items)),)), nullable
+            if set(items) & set(CONSTRAINTS):
+                raise UnsupportedSchema("Constraints on array items are not supported")
+            return TypeRef('List', (self.type_of(name, items)[0],)), nullable
+        if type_ == 'object':
+            values = schema.get('additionalProperties', True)
+            if isinstance(values, dict) and values:
+                if self.is_object(values) or set(values) & set(CONSTRAINTS):
+                    raise UnsupportedSchema("Maps of objects are not supported")
+                return TypeRef('Dict', (self.type_of(name, values)[0],)), nullable
+            return TypeRef('Dict', (TypeRef('Any'),)), nullable
+        raise UnsupportedSchema(f"Unsupported type '{type_}'")
+
+
+@dataclass
+class CompiledToolSet:
+    code: str
+    module: types.ModuleType
+
+
+def stub_function(name: str, model: type, module_name: str, return_args: bool):
+    def stub(args):
+        return args if return_args else None
+    stub.__name__ = stub.__qualname__ = name
+    stub.__module__ = module_name
+    stub.__annotations__ = {'args': model}
+    return stub
+
+
+def compile_tool_set(tools: list[dict], tool_models: dict[str, str], module_name: str,
+                     return_args: bool = False) -> CompiledToolSet:
+    """
+    Builds the source and model module of a tool set in one pass over its schemas
+    Raises UnsupportedSchema when any tool needs datamodel-code-generator
+    """
+    if len(tool_models) < len(tools):
+        raise UnsupportedSchema("Tool names are used twice")
+    compiler = SchemaCompiler(reserved=set(tool_models) | set(tool_models.values()))
+    for tool in tools:
+        compiler.add_model(tool_models[tool['function']['name']], tool['function']['parameters'], exact=True)
+
+    stubs = [
+        f"def {name}(args: {model_name}):\n    # implementation left out for brevity\n    {'return args' if return_args else 'pass'}"
+        for name, model_name in tool_models.items()
+    ]
+    code = "\n\n\n".join([HEADER.rstrip('\n'), *(model.source() for model in compiler.models), *stubs]) + "\n"
+
+    module = types.ModuleType(module_name)
+    module.__dict__.update(HEADER_NAMES)
+    models = {}
+    for spec in compiler.models:
+        models[spec.name] = spec.build(models, module_name)
+    module.__dict__.update(models)
+    for name, model_name in tool_models.items():
+        setattr(module, name, stub_function(name, models[model_name], module_name, return_args))
+    return CompiledToolSet(code, module)
@@ -0,0 +1,50 @@
+import re
+from typing import List, Tuple
+from utils.code_execution import CODE_BLOCK_PATTERN, CODE_BLOCK_REGEX
+
+
+class CodeBlockScanner:
+    """
+    Incrementally finds fenced code blocks in streamed text.
+
+    Deltas are fed as they arrive and every block is reported as soon as its
+    closing fence is seen, using the same pattern as extract_code so that the
+    streamed and buffered paths agree on what a code block is.
+    """
+
+    def __init__(self, pattern: str = CODE_BLOCK_PATTERN):
+        self._pattern = CODE_BLOCK_REGEX if pattern == CODE_BLOCK_PATTERN else re.compile(pattern, flags=re.DOTALL)
+        self._buffer = ""
+        self._parts: List[str] = []
+        self.blocks_found = 0
+
+    @property
+    def text(self) -> str:
+        """The full text fed so far"""
+        return "".join(self._parts)
+
+    def feed(self, delta: str) -> List[Tuple[str, str]]:
+        """Adds a text delta and returns the (language, code) blocks it completed"""
+        if not delta:
+            return []
+        self._parts.append(delta)
+        self._buffer += delta
+
+        # A block can only be completed by a delta containing part of a closing fence
+        if '`' not in delta:
+            return []
+
+        blocks = []
+        position = 0
+        while True:
+            match = self._pattern.search(self._buffer, position)
+            if not match:
+                break
+            blocks.append((match.group(1) or "", match.group(2)))
+            position = match.end()
+
+        # Keep only the text that may still belong to an unterminated block
+        fence = self._buffer.find('```', position)
+        self._buffer = self._buffer[fence:] if fence != -1 else self._buffer[-2:]
+        self.blocks_found += len(blocks)
+        return blocks
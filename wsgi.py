@@ -0,0 +1,37 @@
+"""
+WSGI entry point for pre-forking servers:
+
+    PROXY_ARGS="--base-url https://api.deepseek.com --preload-tools tools.jsonl" gunicorn --preload --workers 4 wsgi:app
+
+PROXY_ARGS holds the command line flags of app.py. Importing this module configures
+the request pipeline and warms it up: dependencies are imported, the tool sets of
+--preload-tools compiled and the heap frozen. With gunicorn --preload that happens once
+in the master process, and the forked workers share those pages copy-on-write.
+Threads, connections and worker pools don't survive a fork, so every worker starts
+its own router, request log, response cache and pools on its first request.
+"""
+import os
+import shlex
+import threading
+from app import build_parser, configure_pipeline, configure_services, warm_up_modules
+from core.api import app
+from core.warmup import preload
+
+args = build_parser().parse_args(shlex.split(os.environ.get("PROXY_ARGS", "")))
+configure_pipeline(args)
+preload(args.preload_tools, warm_up_modules(args))
+
+# Process the services were started in, they are started again after a fork
+services_pid = None
+services_lock = threading.Lock()
+
+
+@app.before_request
+def start_services():
+    global services_pid
+    if services_pid == os.getpid():
+        return
+    with services_lock:
+        if services_pid != os.getpid():
+            configure_services(args)
+            services_pid = os.getpid()